@@ -0,0 +1,108 @@
+import logging
+import queue
+import threading
+
+from auction.rl import REINFORCEAgent
+
+class AsyncLearner(object):
+    '''
+    Train a lookahead policy in a background thread, off the dispatch loop.
+    The actors' agent only samples bids, the learner trains its own copy of the policy on the submitted experience
+    and publishes the new weights, which the actors pull between allocations.
+    Experience submitted while the queue is full is dropped instead of blocking the dispatch.
+    An exception raised by the training stops the learner, it is raised again by submit, pull and close.
+    '''
+    def __init__(self, agent, max_queue_size=16, publish_interval=1):
+        '''
+        agent: REINFORCEAgent of the actors
+        max_queue_size: number of pending experience batches
+        publish_interval: number of updates between published weights
+        '''
+        self.agent = agent
+        self.publish_interval = publish_interval
+        self.learner_agent = REINFORCEAgent(agent.x_dim, agent.a_dim, lr=agent.lr, gamma=agent.gamma, seed=0)
+        self.learner_agent.policy.load_state_dict(agent.policy.state_dict())
+        self.learner_agent.optimizer.load_state_dict(agent.optimizer.state_dict())
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.lock = threading.Lock()
+        # Latest published weights and their version
+        self.state_dict = None
+        self.version = 0
+        self.pulled_version = 0
+        self.num_updates = 0
+        self.num_dropped = 0
+        # Exception which stopped the learner thread
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, states, actions, rewards, dones):
+        '''
+        Queue a batch of experience for the learner, return False if it is dropped.
+        The learner reads the arrays later, they must not be modified.
+        '''
+        self._check()
+        try:
+            self.queue.put_nowait((states, actions, rewards, dones))
+        except queue.Full:
+            self.num_dropped += 1
+            logging.info('Drop an experience batch, the learner is behind.')
+            return False
+        return True
+
+    def pull(self):
+        '''
+        Load the latest published weights into the actors' agent, return True if they are new.
+        '''
+        self._check()
+        if self.version == self.pulled_version:
+            return False
+        with self.lock:
+            state_dict, version = self.state_dict, self.version
+        self.agent.policy.load_state_dict(state_dict)
+        self.pulled_version = version
+        return True
+
+    def close(self):
+        '''
+        Train on the pending experience, stop the thread and pull the final weights.
+        '''
+        if self.thread is None:
+            self._check()
+            return
+        # A stopped learner does not empty the queue anymore
+        while self.thread.is_alive():
+            try:
+                self.queue.put(None, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        self.thread.join()
+        self.thread = None
+        self._check()
+        self._publish()
+        self.pull()
+
+    def _run(self):
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                break
+            try:
+                self.learner_agent.train(*batch)
+            except Exception as e:
+                self.error = e
+                break
+            self.num_updates += 1
+            if self.num_updates % self.publish_interval == 0:
+                self._publish()
+
+    def _check(self):
+        if self.error is not None:
+            raise self.error
+
+    def _publish(self):
+        state_dict = {name: tensor.detach().clone() for name, tensor in self.learner_agent.policy.state_dict().items()}
+        with self.lock:
+            self.state_dict = state_dict
+            self.version += 1
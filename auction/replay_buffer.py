@@ -0,0 +1,48 @@
+import numpy as np
+
+class ExperienceBuffer(object):
+    '''
+    Ring buffer of (state, action, reward, done) experience in preallocated arrays of capacity rows,
+    the oldest experience is overwritten when it is full.
+    The log-probabilities of the actions are not kept, they are recomputed from the states and actions at training.
+    '''
+    def __init__(self, capacity, x_dim, a_dim):
+        if capacity <= 0:
+            raise Exception('error: capacity must be positive.')
+        self.capacity = capacity
+        self.states = np.zeros((capacity, x_dim), dtype=np.float32)
+        self.actions = np.zeros((capacity, a_dim), dtype=np.float32)
+        self.rewards = np.zeros(capacity)
+        self.dones = np.zeros(capacity, dtype=bool)
+        # Row of the oldest experience and number of experiences
+        self.start = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, state, action, reward, done):
+        idx = (self.start + self.size) % self.capacity
+        self.states[idx] = state
+        self.actions[idx] = action
+        self.rewards[idx] = reward
+        self.dones[idx] = done
+        if self.size < self.capacity:
+            self.size += 1
+        else:
+            self.start = (self.start + 1) % self.capacity
+
+    def get(self):
+        '''
+        Retrieve states, actions, rewards and dones from the oldest to the latest experience.
+        They are views of the buffer unless it has wrapped around, valid until the next append or clear.
+        '''
+        end = self.start + self.size
+        if end <= self.capacity:
+            return self.states[self.start:end], self.actions[self.start:end], self.rewards[self.start:end], self.dones[self.start:end]
+        order = np.arange(self.start, end) % self.capacity
+        return self.states[order], self.actions[order], self.rewards[order], self.dones[order]
+
+    def clear(self):
+        self.start = 0
+        self.size = 0
@@ -18,6 +18,37 @@ The action is [0, 1]
 
 eps = np.finfo(np.float32).eps.item()
 
+def discount_rewards(rewards, dones, gamma, chunk_size=256):
+    '''
+    Retrieve the discounted returns R[t] = rewards[t] + gamma * R[t + 1], R[t + 1] is dropped when dones[t].
+    The returns are reverse cumulative sums of rewards[t] * gamma^t, computed by chunks of at most chunk_size,
+    short enough for gamma^t to stay within 1e-100 and 1e100, the return at the start of a chunk is carried to the previous one.
+    '''
+    if gamma == 0:
+        return np.array(rewards, dtype=np.float64)
+    if gamma != 1:
+        chunk_size = max(1, min(chunk_size, int(100 * np.log(10) / abs(np.log(gamma)))))
+    returns = np.empty(len(rewards))
+    carry = 0.0
+    for start in range(((len(rewards) - 1) // chunk_size) * chunk_size, -1, -chunk_size):
+        r, d = rewards[start:start + chunk_size], dones[start:start + chunk_size]
+        n = len(r)
+        t = np.arange(n)
+        powers = gamma ** t
+        # sums[t] = sum of rewards[k] * gamma^k for k >= t
+        sums = np.zeros(n + 1)
+        sums[:n] = np.cumsum((r * powers)[::-1])[::-1]
+        # Each return sums up to the first done at or after it, or to the end of the chunk and the carry
+        done_idx = np.flatnonzero(d)
+        pos = np.searchsorted(done_idx, t)
+        ends = np.append(done_idx, n - 1)[pos]
+        chunk_returns = (sums[t] - sums[ends + 1]) / powers
+        open_ended = (pos == len(done_idx))
+        chunk_returns[open_ended] += carry * gamma ** (n - t[open_ended])
+        returns[start:start + n] = chunk_returns
+        carry = chunk_returns[0]
+    return returns
+
 class Policy(nn.Module):
     def __init__(self, x_dim, a_dim):
         super(Policy, self).__init__()
@@ -34,36 +65,82 @@ class Policy(nn.Module):
         return mu, sigma
 
 class REINFORCEAgent(object):
-    def __init__(self, x_dim, a_dim, lr=1e-3, gamma=0.99):
+    def __init__(self, x_dim, a_dim, lr=1e-3, gamma=0.99, seed=None):
+        '''
+        seed: seed of the initial weights and the sampled actions, without touching torch's global RNG (None: fresh entropy)
+        '''
         self.x_dim = x_dim
         self.a_dim = a_dim
         self.lr = lr
         self.gamma = gamma
-        self.policy = Policy(self.x_dim, self.a_dim)
+        self.generator = torch.Generator()
+        if seed is None:
+            self.generator.seed()
+            self.policy = Policy(self.x_dim, self.a_dim)
+        else:
+            self.generator.manual_seed(seed)
+            with torch.random.fork_rng(devices=[]):
+                torch.manual_seed(seed)
+                self.policy = Policy(self.x_dim, self.a_dim)
         self.optimizer = optim.Adam(self.policy.parameters(), lr=self.lr)
 
+    def save(self, path):
+        '''
+        Save the policy and the optimizer state to path.
+        '''
+        torch.save({'x_dim': self.x_dim, 'a_dim': self.a_dim, 'policy': self.policy.state_dict(), 'optimizer': self.optimizer.state_dict()}, path)
+
+    def load(self, path):
+        '''
+        Load the policy and the optimizer state saved at path.
+        '''
+        checkpoint = torch.load(path, weights_only=True)
+        if (checkpoint['x_dim'], checkpoint['a_dim']) != (self.x_dim, self.a_dim):
+            raise Exception('error: the policy at {} is ({}, {}), not ({}, {}).'.format(path, checkpoint['x_dim'], checkpoint['a_dim'], self.x_dim, self.a_dim))
+        self.policy.load_state_dict(checkpoint['policy'])
+        self.optimizer.load_state_dict(checkpoint['optimizer'])
+
     def act(self, state):
-        state = torch.from_numpy(state).float().unsqueeze(0)
-        mu, sigma = self.policy(state)
-        dist = Normal(mu, sigma)
-        action = dist.sample()
-        action_log_prob = dist.log_prob(action)
-        return action, action_log_prob
-                
-    def train(self, states, actions, log_probs, rewards, dones):
-        R = 0
-        policy_loss = []
-        discounted_rewards = []
-        for r in rewards[::-1]:
-            R = r + self.gamma * R
-            discounted_rewards.insert(0, R)
-            rewards = torch.tensor(rewards)
-        discounted_rewards = torch.tensor(discounted_rewards)
-        discounted_rewards = (discounted_rewards - discounted_rewards.mean()) / (discounted_rewards.std() + eps)
-        for log_prob, discounted_reward in zip(log_probs, discounted_rewards):
-            policy_loss.append(-log_prob * discounted_reward)
+        '''
+        Sample the action of a single state, see act_batch.
+        '''
+        actions, action_log_probs = self.act_batch(np.asarray(state)[None])
+        return actions[0], action_log_probs[0]
+
+    def act_batch(self, states):
+        '''
+        Sample the actions of states (n, x_dim) in one forward pass without building the autograd graph.
+        Return the actions (n, a_dim) and their log-probabilities (n, a_dim) as arrays, the log-probabilities
+        are only recorded, train recomputes them from the states and actions.
+        '''
+        with torch.no_grad():
+            mu, sigma = self.policy(torch.as_tensor(states, dtype=torch.float32))
+            actions = torch.normal(mu, sigma, generator=self.generator)
+            action_log_probs = Normal(mu, sigma).log_prob(actions)
+        return actions.numpy(), action_log_probs.numpy()
+
+    def log_prob(self, states, actions):
+        '''
+        Retrieve the log-probabilities (n, a_dim) of actions in states under the current policy, with gradient.
+        '''
+        mu, sigma = self.policy(torch.as_tensor(np.asarray(states), dtype=torch.float32))
+        actions = torch.as_tensor(np.asarray(actions), dtype=torch.float32).reshape(mu.shape)
+        return Normal(mu, sigma).log_prob(actions)
+
+    def train(self, states, actions, rewards, dones):
+        '''
+        Update the policy with one loss over all the experience, dones end the episodes.
+        The log-probabilities of the actions are recomputed by log_prob.
+        '''
+        discounted_rewards = discount_rewards(np.asarray(rewards, dtype=np.float64), np.asarray(dones, dtype=bool), self.gamma)
+        discounted_rewards = torch.as_tensor(discounted_rewards, dtype=torch.float32)
+        if len(discounted_rewards) > 1:
+            discounted_rewards = (discounted_rewards - discounted_rewards.mean()) / (discounted_rewards.std() + eps)
+        else:
+            # No spread to normalize by, the normalized reward of a single experience is 0
+            discounted_rewards = discounted_rewards - discounted_rewards.mean()
+        policy_loss = -(self.log_prob(states, actions).sum(dim=1) * discounted_rewards).sum()
 
         self.optimizer.zero_grad()
-        policy_loss = torch.cat(policy_loss).sum()
         policy_loss.backward()
         self.optimizer.step()
@@ -2,19 +2,36 @@ import logging
 import json
 import numpy as np
 
-from auction.taxi_driver import TaxiDriver
+from auction.taxi_driver import TaxiDriver, PlanBatch
 from auction.rl import REINFORCEAgent
-from util.timeline import TimeLineEvent
+from auction.async_learner import AsyncLearner
+from simulator.customer_call import CustomerCallBatch
+from util import profiling
 
 class TaxiCoordinator(object):
     def __init__(self, city, auction_type, payment_rule, drivers_schedule, init_pos, bidding_strategy, driving_velocity=30,
-                    payment_ratio=0.3, charge_rate_per_kilometer=60, gas_cost_per_kilometer=4, waiting_time_threshold=15):
+                    payment_ratio=0.3, charge_rate_per_kilometer=60, gas_cost_per_kilometer=4, waiting_time_threshold=15, rng=None, event_log=None,
+                    joint_training=False, async_training=False, policy_checkpoint=None, inference_only=False):
         '''
         city: where the taxi coordinator works on
         auction_type: auction mechanism
         drivers_schedule: determine how many drivers in a period.
         init_pos: initial pos of all drivers
+        rng: numpy Generator, seed or SeedSequence, each driver and the lookahead policy get a child stream (None: fresh entropy)
+        event_log: util.event_log.EventLog the allocations are streamed to instead of the in-memory histories
+        joint_training: update the lookahead policy once with the experience of all drivers instead of once per driver
+        async_training: train the lookahead policy in an auction.async_learner.AsyncLearner, call close at the end
+        policy_checkpoint: path of a saved lookahead policy to start from (see REINFORCEAgent.save)
+        inference_only: the drivers do not keep the lookahead bids' experience, the policy is not trained
         '''
+        self.event_log = event_log
+        self.joint_training = joint_training
+        self.async_training = async_training
+        self.policy_checkpoint = policy_checkpoint
+        self.inference_only = inference_only
+        self.lookahead_policy = None
+        self.learner = None
+        self.rng = np.random.default_rng(rng)
         self.driving_velocity = driving_velocity
         self.payment_ratio = payment_ratio
         self.charge_rate_per_kilometer = charge_rate_per_kilometer
@@ -28,7 +45,8 @@ class TaxiCoordinator(object):
         self.drivers = self._init_drivers(drivers_schedule)
         self.current_payoff = 0
         self.history_payoff = []
-        self.history_calls = []
+        # (CustomerCallBatch, winner driver of each call or -1) of every allocation
+        self.history_call_batches = []
         self.prev_time = 0
 
     def get_payoff(self):
@@ -38,50 +56,164 @@ class TaxiCoordinator(object):
         return self.current_payoff
 
     def get_history_payoff(self):
+        if self.event_log is not None:
+            return self.event_log.get_history_payoff()
         return np.asarray(self.history_payoff)
 
     def dump_history_payoff(self, path):
-        np.save(path, np.asarray(self.history_payoff))
+        np.save(path, self.get_history_payoff())
+
+    def get_history_calls(self):
+        if self.event_log is not None:
+            return self.event_log.get_history_calls()
+        history_calls = []
+        for customer_calls, winners in self.history_call_batches:
+            for time, start_x, start_y, accept in zip(customer_calls.times.tolist(), customer_calls.start_x.tolist(), customer_calls.start_y.tolist(), (winners >= 0).tolist()):
+                history_calls.append({'time': time, 'start_pos': (start_x, start_y), 'accept': accept})
+        return history_calls
 
     def dump_history_calls_json(self, path):
         with open(path, 'w') as f:
-            json.dump(self.history_calls, f)
+            json.dump(self.get_history_calls(), f)
 
     def allocate(self, customer_calls):        
-        for customer_call in customer_calls:
-            if self.prev_time > customer_call.time:            
-                raise Exception('error: customer_calls must be sorted. ({} > {})'.format(self.prev_time, customer_call.time))
-            self.prev_time = max(customer_call.time, self.prev_time)
-            has_call_taken = False
-            # Find all unrestricted drivers, if there is no unrestricted drivers, drop this call
+        '''
+        Allocate customer calls (a CustomerCallBatch or a list of CustomerCall) sorted by time.
+        Return the index of the winner driver of each call, -1 for a rejected call.
+        '''
+        if not isinstance(customer_calls, CustomerCallBatch):
+            customer_calls = CustomerCallBatch.from_calls(customer_calls, self.city.city_graph)
+        if len(customer_calls) == 0:
+            return np.zeros(0, dtype=np.int64)
+        self._start_calls(customer_calls.times)
+        winners = np.full(len(customer_calls), -1, dtype=np.int64)
+        for idx, customer_call in enumerate(customer_calls):
+            winners[idx] = self._allocate_call(customer_call)
+        self.record_calls(customer_calls, winners)
+        return winners
+
+    def allocate_call(self, customer_call):
+        '''
+        Allocate a single customer call, later than the calls allocated before.
+        Return the index of the winner driver, -1 if the call is rejected. The call is recorded by record_calls.
+        '''
+        self._start_calls(np.array([customer_call.time]))
+        return self._allocate_call(customer_call)
+
+    def record_calls(self, customer_calls, winners):
+        '''
+        Record a CustomerCallBatch and the winner of each call in the history (see get_history_calls),
+        winners may be filled in after the call.
+        '''
+        if self.event_log is None:
+            self.history_call_batches.append((customer_calls, winners))
+
+    def _start_calls(self, times):
+        '''
+        Check the calls come in time order before allocating them.
+        '''
+        prev_times = np.concatenate([[self.prev_time], times[:-1]])
+        if np.any(prev_times > times):
+            idx = int(np.argmax(prev_times > times))
+            raise Exception('error: customer_calls must be sorted. ({} > {})'.format(prev_times[idx], times[idx]))
+        self.prev_time = max(times[-1], self.prev_time)
+        if self.learner is not None:
+            self.learner.pull()
+        profiling.count('calls', len(times))
+
+    def _allocate_call(self, customer_call):
+        winner = -1
+        # Find all unrestricted drivers, if there is no unrestricted drivers, drop this call
+        with profiling.timer('coordinator.unrestricted_drivers'):
             unrestricted_drivers = self._get_unrestricted_drivers(customer_call)
-            if len(unrestricted_drivers) > 0:
-                # Request drivers's plans
-                plans = [driver.generate_plan(customer_call) for driver in unrestricted_drivers]
-
-                # Check the availability with drivers' timeline
-                available_drivers_and_plans = [(driver, plan) for driver, plan in zip(unrestricted_drivers, plans) if driver.is_available(plan) and plan.waiting_time_period < self.waiting_time_threshold and plan.value >= 0]                 
-                if len(available_drivers_and_plans) > 0:
-                    # Select the drivers according to auction algorithm
+        if len(unrestricted_drivers) > 0:
+            # Request drivers's plans, evaluated for all drivers at once
+            with profiling.timer('coordinator.plans'):
+                plans = PlanBatch(unrestricted_drivers, customer_call)
+            profiling.count('plans', len(plans))
+
+            # Check the waiting time and the value on the whole batch, then the availability with drivers' timeline
+            candidates = np.flatnonzero((plans.waiting_time_periods < self.waiting_time_threshold) & (plans.values >= 0))
+            available_drivers_and_plans = []
+            with profiling.timer('coordinator.is_available'):
+                for k in candidates:
+                    driver, plan = unrestricted_drivers[k], plans.get_plan(k)
+                    if driver.is_available(plan):
+                        available_drivers_and_plans.append((driver, plan))
+            if len(available_drivers_and_plans) > 0:
+                # Select the drivers according to auction algorithm
+                with profiling.timer('coordinator.choose_bid'):
                     winner_driver, winner_plan, winner_payment = self._choose_bid(available_drivers_and_plans)
-                    
-                    # Assign the customer call to the winner
-                    winner_driver.assign(winner_plan, winner_payment)
-                    
-                    # Increase the coordinator's payoff
-                    self._accumulate_payoff(winner_payment)
+                
+                # Assign the customer call to the winner
+                with profiling.timer('driver.assign'):
+                    winner_payoff = winner_driver.assign(winner_plan, winner_payment)
+                
+                # Increase the coordinator's payoff
+                self._accumulate_payoff(winner_payment)
+                if self.event_log is not None:
+                    self.event_log.append_accept(customer_call, winner_driver.idx, winner_plan, winner_payment, winner_payoff)
+                else:
                     self.history_payoff.append(winner_payment)
-                    has_call_taken = True
-            if has_call_taken:
-                logging.debug('Accept {}'.format(customer_call))
-            self.history_calls.append({'time': customer_call.time, 'start_pos': customer_call.start_pos, 'accept': has_call_taken})
+                winner = winner_driver.idx
+        if winner >= 0:
+            logging.debug('Accept {}'.format(customer_call))
+        elif self.event_log is not None:
+            self.event_log.append_reject(customer_call)
+        return winner
 
     def train(self):
+        '''
+        Update the lookahead policy with the drivers' experience, or submit it to the learner.
+        '''
+        if self.inference_only:
+            return
+        with profiling.timer('coordinator.train'):
+            for policy, states, actions, rewards, dones in self._get_training_batches():
+                if self.learner is not None:
+                    # The batch may be a view of a driver's buffer, which is reused
+                    self.learner.submit(np.array(states), np.array(actions), np.array(rewards), np.array(dones))
+                else:
+                    policy.train(states, actions, rewards, dones)
+
+    def close(self):
+        '''
+        Finish the asynchronous training, the drivers get the final policy.
+        '''
+        if self.learner is not None:
+            self.learner.close()
+
+    def save_policy(self, path):
+        '''
+        Save the lookahead policy and its optimizer state, the learner's with asynchronous training.
+        '''
+        if self.lookahead_policy is None:
+            raise Exception('error: only the lookahead bidding strategy has a policy.')
+        agent = self.learner.learner_agent if self.learner is not None else self.lookahead_policy
+        agent.save(path)
+
+    def _get_training_batches(self):
+        '''
+        Retrieve (policy, states, actions, rewards, dones) of the drivers' experience and clear it.
+        '''
+        histories = []
         for driver in self.drivers:
-            states, actions, action_log_probs, rewards, dones = driver.get_history()
-            if len(states) > 0 and len(actions) > 0 and len(action_log_probs) > 0 and len(rewards) > 0 and len(dones) > 0:
-                driver.lookahead_policy.train(states, actions, action_log_probs, rewards, dones)
+            states, actions, rewards, dones = driver.get_history()
+            if len(states) > 0:
+                histories.append((driver.lookahead_policy, states, actions, rewards, dones))
             driver.clear_history()
+        if self.joint_training and len(histories) > 0:
+            # One batch per policy, each driver's experience is an episode
+            policies = {}
+            for history in histories:
+                policies.setdefault(id(history[0]), []).append(history)
+            histories = []
+            for policy_histories in policies.values():
+                for _, _, _, _, dones in policy_histories:
+                    dones[-1] = True
+                columns = [np.concatenate(column) for column in zip(*[history[1:] for history in policy_histories])]
+                histories.append((policy_histories[0][0], *columns))
+        return histories
 
     def _init_drivers(self, drivers_schedule):
         '''
@@ -89,18 +221,29 @@ class TaxiCoordinator(object):
         Each schedule is a tuple (shift_start, shift_end) in simulation time(hr)
         '''        
         drivers = []
+        driver_rngs = self.rng.spawn(len(drivers_schedule))
         lookahead_policy = None
         if self.bidding_strategy == 'lookahead':            
-            lookahead_policy = REINFORCEAgent(7, 1)
+            lookahead_policy = REINFORCEAgent(7, 1, seed=int(self.rng.integers(2**63)))
+            if self.policy_checkpoint is not None:
+                lookahead_policy.load(self.policy_checkpoint)
+            if self.async_training and not self.inference_only:
+                self.learner = AsyncLearner(lookahead_policy)
+        elif self.policy_checkpoint is not None:
+            raise Exception('error: only the lookahead bidding strategy has a policy to load.')
+        self.lookahead_policy = lookahead_policy
         for idx, schedule in enumerate(drivers_schedule):
             driver = TaxiDriver(idx=idx, init_pos=self.init_pos, city_graph=self.city.city_graph,
                             bidding_strategy=self.bidding_strategy, lookahead_policy=lookahead_policy,
                             payment_ratio=self.payment_ratio,
                             charge_rate_per_kilometer=self.charge_rate_per_kilometer,
                             gas_cost_per_kilometer=self.gas_cost_per_kilometer,
-                            driving_velocity=self.driving_velocity)
+                            driving_velocity=self.driving_velocity,
+                            rng=driver_rngs[idx],
+                            event_log=self.event_log,
+                            collect_history=not self.inference_only)
             for event in schedule:
-                driver.timeline.add_event(TimeLineEvent(event[0], event[1], 'Shift')) 
+                driver.add_shift(event[0], event[1])
             drivers.append(driver)
         return drivers
 
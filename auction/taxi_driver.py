@@ -1,14 +1,12 @@
+import bisect
 import logging
 import copy
 import numpy as np
 
-from collections import namedtuple
-
 from sortedcontainers import SortedList
 
 from util.timeline import TimeLine, TimeLineEvent
-
-Experience = namedtuple('Experience', ['state', 'action', 'action_log_prob', 'reward', 'done'])
+from auction.replay_buffer import ExperienceBuffer
 
 def make_state(start_pos, pickup_pos, end_pos, start_time):
     state = np.array([  start_pos[0], start_pos[1],
@@ -16,6 +14,24 @@ def make_state(start_pos, pickup_pos, end_pos, start_time):
                         end_pos[0], end_pos[1],
                         start_time])
     return state
+
+def make_states(start_poses, pickup_pos, end_pos, start_times):
+    '''
+    Retrieve the states (n, 7) of many drivers' plans for the same call, the rows of make_state
+    '''
+    states = np.empty((len(start_poses), 7))
+    states[:, 0:2] = start_poses
+    states[:, 2:4] = pickup_pos
+    states[:, 4:6] = end_pos
+    states[:, 6] = start_times
+    return states
+
+def compute_value(distance_to_customer, distance_to_dest, charge_rate_per_kilometer, gas_cost_per_kilometer, ratio):
+    '''
+    Retrieve the true value of a plan, works on scalars and on arrays of plans
+    '''
+    chargeable_distance = distance_to_dest
+    return ratio * (chargeable_distance * (charge_rate_per_kilometer - gas_cost_per_kilometer) - distance_to_customer * gas_cost_per_kilometer)
  
 
 class Plan(object):
@@ -47,10 +63,179 @@ class Plan(object):
                                                                         self.requested_distance,
                                                                         self.bid, self.value)
 
+class PlanBatch(object):
+    '''
+    Plans of many drivers for the same call.
+    The pickup to destination leg is computed once, pickup legs once per distinct start position,
+    waiting times, values and bids are computed as arrays and Plan objects are only built on demand.
+    '''
+    def __init__(self, drivers, call):
+        self.drivers = drivers
+        self.call = call
+        city_graph = drivers[0].city_graph
+        self.distance_to_dest, self.route_to_dest = city_graph.get_pos_shortest_distance(call.start_pos, call.destination_pos)
+
+        starts = [driver._get_start(call) for driver in drivers]
+        self.start_poses = [start_pos for _, start_pos in starts]
+        pickup_legs = {}
+        for start_pos in self.start_poses:
+            if start_pos not in pickup_legs:
+                pickup_legs[start_pos] = city_graph.get_pos_shortest_distance(start_pos, call.start_pos)
+        self.pickup_legs = pickup_legs
+
+        driving_velocities = np.array([driver.driving_velocity for driver in drivers], dtype=np.float64)
+        charge_rates = np.array([driver.charge_rate_per_kilometer for driver in drivers], dtype=np.float64)
+        gas_costs = np.array([driver.gas_cost_per_kilometer for driver in drivers], dtype=np.float64)
+        value_ratios = np.array([driver.value_ratio for driver in drivers], dtype=np.float64)
+
+        self.start_times = np.array([start_time for start_time, _ in starts], dtype=np.float64)
+        self.pickup_distances = np.array([pickup_legs[start_pos][0] for start_pos in self.start_poses], dtype=np.float64)
+
+        # waiting_time = elapsed time from when call came to when the customer is pickuped
+        self.waiting_time_periods = np.abs(self.start_times - call.time) + self.pickup_distances / driving_velocities
+        # driving_time = elapsed time from when the driver starts handling this call to when the customer arrived at the dest
+        self.end_times = self.start_times + (self.pickup_distances + self.distance_to_dest) / driving_velocities
+        self.values = compute_value(self.pickup_distances, self.distance_to_dest, charge_rates, gas_costs, 1.0)
+        self.bids, self.bid_log_probs = self._compute_bidding_prices(compute_value(self.pickup_distances, self.distance_to_dest, charge_rates, gas_costs, value_ratios))
+
+    def __len__(self):
+        return len(self.drivers)
+
+    def _compute_bidding_prices(self, bid_values):
+        '''
+        Retrieve the bidding prices of all drivers:
+            truthful: the value of the plan
+            shade: the value scaled by (1 + c), c uniform in [0, 1) drawn from the driver's stream
+            lookahead: an action sampled from the driver's lookahead policy
+        '''
+        strategies = np.array([driver.bidding_strategy for driver in self.drivers])
+        bids = np.zeros(len(self.drivers))
+        bid_log_probs = [0.0] * len(self.drivers)
+
+        truthful = (strategies == 'truthful')
+        bids[truthful] = np.clip(bid_values[truthful], 0, 1e9)
+        shade = (strategies == 'shade')
+        # Each driver draws from its own stream, so its numbers do not depend on the other drivers in the batch
+        c = np.array([self.drivers[k].rng.random() for k in np.flatnonzero(shade)])
+        bids[shade] = np.clip((c + 1.0) * bid_values[shade], 0, 1e9)
+        lookahead = np.flatnonzero(strategies == 'lookahead')
+        if len(lookahead) > 0:
+            # One forward pass per policy over the states of all its drivers
+            policies = {}
+            for k in lookahead.tolist():
+                policies.setdefault(id(self.drivers[k].lookahead_policy), []).append(k)
+            for ks in policies.values():
+                states = make_states([self.start_poses[k] for k in ks], self.call.start_pos, self.call.destination_pos, self.start_times[ks])
+                actions, action_log_probs = self.drivers[ks[0]].lookahead_policy.act_batch(states)
+                bids[ks] = actions[:, 0]
+                for k, action_log_prob in zip(ks, action_log_probs[:, 0].tolist()):
+                    bid_log_probs[k] = action_log_prob
+        return bids, bid_log_probs
+
+    def get_plan(self, k):
+        '''
+        Build the Plan of the k-th driver.
+        '''
+        start_pos = self.start_poses[k]
+        route_to_customer = self.pickup_legs[start_pos][1]
+        return Plan(self.start_times[k], self.end_times[k], start_pos, self.call.start_pos, self.call.destination_pos,
+                waiting_time_period=self.waiting_time_periods[k],
+                pickup_distance=self.pickup_distances[k],
+                requested_distance=self.distance_to_dest,
+                bid=self.bids[k], bid_log_prob=self.bid_log_probs[k], value=self.values[k],
+                route=route_to_customer + self.route_to_dest)
+
+class DriverState(object):
+    '''
+    Incrementally updated summary of a driver's schedule.
+    next_free_time, end_pos, latest_start_time, restricted_until: from the latest plan, updated in assign.
+    last_shift_end, next_shift_start, last_call_end: the events around the current time, updated at shift
+    transitions by advancing cursors, which is O(1) amortized while calls come in time order.
+    '''
+    def __init__(self):
+        self.next_free_time = None
+        self.end_pos = None
+        self.latest_start_time = None
+        self.restricted_until = None
+
+        # Shifts and calls in the timeline, sorted (events never overlap)
+        self.shift_starts = []
+        self.shift_ends = []
+        self.call_ends = []
+        self.last_call_start = None
+
+        # Cursors: number of shifts / calls ended before time, None time means the cursors must be re-seeked
+        self.time = None
+        self.shift_cursor = 0
+        self.call_cursor = 0
+        self.last_shift_end = None
+        self.next_shift_start = None
+        self.last_call_end = None
+
+    def add_shift(self, start_time, end_time):
+        idx = bisect.bisect_left(self.shift_starts, start_time)
+        self.shift_starts.insert(idx, start_time)
+        self.shift_ends.insert(idx, end_time)
+        self.time = None
+
+    def add_call(self, start_time, end_time):
+        idx = bisect.bisect_left(self.call_ends, end_time)
+        self.call_ends.insert(idx, end_time)
+        if idx < self.call_cursor:
+            self.time = None
+        if self.last_call_start is None or start_time > self.last_call_start:
+            self.last_call_start = start_time
+
+    def set_latest_plan(self, plan, driving_velocity):
+        self.next_free_time = plan.end_time
+        self.end_pos = plan.end_pos
+        self.latest_start_time = plan.start_time
+        self.restricted_until = plan.start_time + plan.requested_distance / driving_velocity
+
+    def advance(self, time):
+        '''
+        Move the cursors to time.
+        '''
+        if self.time is None or time < self.time:
+            self.shift_cursor = bisect.bisect_left(self.shift_ends, time)
+            self.call_cursor = bisect.bisect_left(self.call_ends, time)
+        else:
+            while self.shift_cursor < len(self.shift_ends) and self.shift_ends[self.shift_cursor] < time:
+                self.shift_cursor += 1
+            while self.call_cursor < len(self.call_ends) and self.call_ends[self.call_cursor] < time:
+                self.call_cursor += 1
+        self.time = time
+        self.last_shift_end = self.shift_ends[self.shift_cursor - 1] if self.shift_cursor > 0 else None
+        self.next_shift_start = self.shift_starts[self.shift_cursor] if self.shift_cursor < len(self.shift_starts) else None
+        self.last_call_end = self.call_ends[self.call_cursor - 1] if self.call_cursor > 0 else None
+
+    def is_after_shift(self):
+        '''
+        Check the last event ended before the current time is a Shift.
+        '''
+        return self.last_shift_end is not None and (self.last_call_end is None or self.last_shift_end > self.last_call_end)
+
+    def get_shift_after(self, time):
+        '''
+        Retrieve the start time of the first shift starting after time.
+        '''
+        idx = bisect.bisect_right(self.shift_starts, time)
+        return self.shift_starts[idx] if idx < len(self.shift_starts) else None
+
 class TaxiDriver(object):
     def __init__(self, idx, init_pos, city_graph, bidding_strategy='truthful', lookahead_policy=None,
-            payment_ratio=0.3, charge_rate_per_kilometer=60, gas_cost_per_kilometer=4, driving_velocity=30):
+            payment_ratio=0.3, charge_rate_per_kilometer=60, gas_cost_per_kilometer=4, driving_velocity=30, rng=None, event_log=None, collect_history=True,
+            history_capacity=4096):
+        '''
+        rng: numpy Generator, seed or SeedSequence of the shaded bids (None: fresh entropy)
+        event_log: util.event_log.EventLog holding the payoffs and plans, only the latest plan is kept in memory
+        collect_history: keep the lookahead bids' experience for training
+        history_capacity: number of experiences kept between trainings, the oldest are overwritten
+        '''
+        self.collect_history = collect_history
+        self.event_log = event_log
         self.idx = idx
+        self.rng = np.random.default_rng(rng)
         #self.value_ratio = 1.0 - payment_ratio
         self.value_ratio = 1.0
         self.charge_rate_per_kilometer = charge_rate_per_kilometer
@@ -63,46 +248,46 @@ class TaxiDriver(object):
         self.city_graph = city_graph
         self.timeline = TimeLine()
         self.plans = SortedList(key=lambda plan: plan.start_time)
+        self.state = DriverState()
         
         if self.bidding_strategy == 'lookahead' and self.lookahead_policy is None:
             raise Exception('error: lookahead policy must not be None.')
         
         # For training lookhead policy
-        self.history = []
+        self.history = None
+        if self.bidding_strategy == 'lookahead' and self.collect_history:
+            self.history = ExperienceBuffer(history_capacity, 7, 1)
 
     def clear_history(self):
-        self.history.clear()
+        if self.history is not None:
+            self.history.clear()
 
     def get_history(self):
-        states = np.array([e.state for e in self.history])
-        actions = np.array([e.action for e in self.history])
-        action_log_probs = np.array([e.action_log_prob for e in self.history])
-        rewards = np.array([e.reward for e in self.history])
-        dones = np.array([e.done for e in self.history])
-        return states, actions, action_log_probs, rewards, dones
+        '''
+        Retrieve states, actions, rewards and dones of the experience, views of the buffer until clear_history.
+        '''
+        if self.history is None:
+            return np.zeros((0, 7), dtype=np.float32), np.zeros((0, 1), dtype=np.float32), np.zeros(0), np.zeros(0, dtype=bool)
+        return self.history.get()
 
     def get_history_payoff(self):
+        if self.event_log is not None:
+            return self.event_log.get_driver_history_payoff(self.idx)
         return np.asarray(self.history_payoffs)
 
     def get_waiting_time_periods(self):
+        if self.event_log is not None:
+            return self.event_log.get_driver_waiting_time_periods(self.idx)
         return np.asarray([plan.waiting_time_period for plan in self.plans])
 
     def is_restricted(self, call):
         '''
         Check this driver is restriced
         '''
-        # Get a latest call which this driver won
-        plan = self._get_latest_plan()
-        if plan is None: 
+        # The latest call which this driver won forbids new calls until restricted_until
+        if self.state.restricted_until is None: 
             return False
-
-        # Compute restricted time period
-        restricted_hrs = plan.requested_distance / self.driving_velocity
-        # Compute forbidden time
-        latest_start_time = plan.start_time
-        forbidden_time = latest_start_time + restricted_hrs
-        
-        return call.time < forbidden_time
+        return call.time < self.state.restricted_until
 
     def is_available(self, plan):
         '''
@@ -112,29 +297,51 @@ class TaxiDriver(object):
         # Check overlap
         valid = self.timeline.is_valid(event)
         # Check return trip
-        after_event = self.timeline.get_after_event(event.start_time)
-        if after_event is not None:
-            if after_event.event_name == 'Shift':
-                dest = plan.end_pos
-                distance_to_origin, _ = self.city_graph.get_pos_shortest_distance(dest, self.init_pos)
-                time_period_to_origin = distance_to_origin / self.driving_velocity
-                time_arrived_origin = plan.end_time + time_period_to_origin
-                valid = (time_arrived_origin <= after_event.start_time)                
+        if self.state.last_call_start is None or plan.start_time >= self.state.last_call_start:
+            # No call starts after the plan, the next event can only be a Shift
+            after_shift_start = self.state.get_shift_after(event.start_time)
+        else:
+            after_event = self.timeline.get_after_event(event.start_time)
+            after_shift_start = after_event.start_time if after_event is not None and after_event.event_name == 'Shift' else None
+        if after_shift_start is not None:
+            dest = plan.end_pos
+            distance_to_origin, _ = self.city_graph.get_pos_shortest_distance(dest, self.init_pos)
+            time_period_to_origin = distance_to_origin / self.driving_velocity
+            time_arrived_origin = plan.end_time + time_period_to_origin
+            valid = (time_arrived_origin <= after_shift_start)                
         return valid
+
+    def add_shift(self, start_time, end_time):
+        '''
+        Add a Shift to driver's schedule.
+        The timeline is only changed by add_shift and assign, which keep the DriverState in sync with it.
+        '''
+        added = self.timeline.add_event(TimeLineEvent(start_time, end_time, 'Shift'))
+        if added:
+            self.state.add_shift(start_time, end_time)
+        return added
        
     def assign(self, plan, payment_to_the_auction):
         '''
         Assign a plan for a driver. This call will be added to driver's schedule. The driver's payoff will be increased.
+        Return the driver's payoff of the plan.
         '''    
         event = TimeLineEvent(plan.start_time, plan.end_time, 'Call', plan.route)
-        self.timeline.add_event(event)
+        if self.timeline.add_event(event):
+            self.state.add_call(plan.start_time, plan.end_time)
         self.plans.add(plan)
+        if self.event_log is not None:
+            # The coordinator logs the plan, only the latest one is needed
+            del self.plans[:-1]
+        self.state.set_latest_plan(self.plans[-1], self.driving_velocity)
         
         plan_payoff = self._compute_payoff(distance_to_customer=plan.pickup_distance, distance_to_dest=plan.requested_distance, payment_to_the_auction=payment_to_the_auction)
-        self.history_payoffs.append(plan_payoff)
-        if self.bidding_strategy == 'lookahead':
-            self.history.append(Experience(plan.make_state(), plan.bid, plan.bid_log_prob, plan_payoff, False))
+        if self.event_log is None:
+            self.history_payoffs.append(plan_payoff)
+        if self.history is not None:
+            self.history.append(plan.make_state(), plan.bid, plan_payoff, False)
         logging.debug('Driver-{} takes {}, payoff {:.2f}'.format(self.idx, plan, plan_payoff))
+        return plan_payoff
    
     def generate_plan(self, call):
         '''
@@ -192,97 +399,35 @@ class TaxiDriver(object):
         return timeline_copy
  
     def _make_plan(self, call):
-        before_event = self.timeline.get_before_event(call.time)
+        return PlanBatch([self], call).get_plan(0)
+
+    def _get_start(self, call):
+        '''
+        Retrieve (start_time, start_pos) from which this driver would start to handle the call.
+        '''
+        state = self.state
+        state.advance(call.time)
 
         # start_time = when to start to pickup + deliever the customer
         # if no plan: start from init_pos and start from calling time
-        if len(self.plans) == 0:
+        if state.latest_start_time is None:
             start_time = call.time
             start_pos = self.init_pos
         # if before event is Shift: start from init_pos
-        elif before_event is not None and before_event.event_name == 'Shift':
+        elif state.is_after_shift():
             start_time = call.time
             start_pos = self.init_pos
         # otherwise: start from latest_plan's end pos and start from latest_plan's end time
         else:
-            latest_plan = self._get_latest_plan()
-            start_time = latest_plan.end_time if latest_plan.end_time > call.time else call.time
-            start_pos = latest_plan.end_pos      
-        pickup_pos = call.start_pos
-        end_pos = call.destination_pos
-
-        distance_to_customer, route_to_customer = self.city_graph.get_pos_shortest_distance(start_pos, pickup_pos)
-        distance_to_dest, route_to_dest = self.city_graph.get_pos_shortest_distance(call.start_pos, call.destination_pos)
-        route = route_to_customer + route_to_dest
-        
-        pickup_time = self._compute_waiting_time(distance_to_customer)
-
-        # waiting_time = elapsed time from when call came to when the customer is pickuped
-        waiting_time_period = abs(start_time - call.time) + pickup_time
-
-        # driving_time = elapsed time from when the driver starts handling this call to when the customer arrived at the dest
-        driving_time = self._compute_driving_time(distance_to_customer, distance_to_dest)
-
-        end_time = start_time + driving_time
-        
-        bid, bid_log_prob = self._compute_bidding_price(start_pos, pickup_pos, end_pos, start_time, distance_to_customer, distance_to_dest)
-        value = self._compute_value(distance_to_customer, distance_to_dest, 1.0)
-        plan = Plan(start_time, end_time, start_pos, pickup_pos, end_pos,
-                waiting_time_period=waiting_time_period,
-                pickup_distance=distance_to_customer,
-                requested_distance=distance_to_dest,
-                bid=bid, bid_log_prob=bid_log_prob, value=value,
-                route=route)
-
-        return plan
-
-    def _get_latest_plan(self):
-        '''
-        Retrieve the latest plan from plans
-        '''
-        if len(self.plans) == 0: 
-            return None
-        return self.plans[-1]
-
-    def _compute_waiting_time(self, distance_to_customer):
-        '''
-        Retrive the waiting time for the customer
-        '''
-        return (distance_to_customer) / self.driving_velocity
-
-    def _compute_driving_time(self, distance_to_customer, distance_to_dest):
-        '''
-        Retrive the required driving time from driver pos to customer's pos and customer's pos to dest
-        '''
-        return (distance_to_customer + distance_to_dest) / self.driving_velocity
-
-    def _compute_bidding_price(self, start_pos, pickup_pos, end_pos, start_time, distance_to_customer, distance_to_dest):
-        '''
-        Retrieve the bidding price.
-        '''
-        if self.bidding_strategy == 'truthful':
-            bid = np.clip(self._compute_value(distance_to_customer, distance_to_dest, self.value_ratio), 0, 1e9)
-            bid_log_prob = 0.0
-        elif self.bidding_strategy == 'shade':
-            c = np.random.random()
-            bid = np.clip((c + 1.0) * self._compute_value(distance_to_customer, distance_to_dest, self.value_ratio), 0, 1e9)
-            bid_log_prob = 0.0
-        elif self.bidding_strategy == 'lookahead':
-            state = make_state(start_pos, pickup_pos, end_pos, start_time)
-            action, action_log_prob = self.lookahead_policy.act(state)
-            bid = action.numpy()[0][0]
-            bid_log_prob = action_log_prob      
-        return bid, bid_log_prob
+            start_time = state.next_free_time if state.next_free_time > call.time else call.time
+            start_pos = state.end_pos
+        return start_time, start_pos
 
     def _compute_value(self, distance_to_customer, distance_to_dest, ratio):
         '''
         Retrieve the true value of plan
         '''
-        chargeable_distance = distance_to_dest
-        charge_rate_per_kilometer = self.charge_rate_per_kilometer
-        total_traveling_distance = (distance_to_customer + distance_to_dest)
-        gas_cost_per_kilometer = self.gas_cost_per_kilometer
-        return ratio * (chargeable_distance * (charge_rate_per_kilometer - gas_cost_per_kilometer) - distance_to_customer * gas_cost_per_kilometer)
+        return compute_value(distance_to_customer, distance_to_dest, self.charge_rate_per_kilometer, self.gas_cost_per_kilometer, ratio)
 
     def _compute_payoff(self, distance_to_customer, distance_to_dest, payment_to_the_auction):
         '''
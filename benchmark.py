@@ -0,0 +1,210 @@
+import argparse
+import itertools
+import json
+import platform
+import time
+import numpy as np
+
+from tabulate import tabulate
+
+from simulator.city import City
+from simulator.city_graph import CityGraph
+from simulator.customer_call import CustomerCall
+from auction.taxi_driver import TaxiDriver
+from auction.taxi_coordinator import TaxiCoordinator
+from util.timeline import TimeLine, TimeLineEvent
+from util.common import daily_schedules_to_weekly_schedules
+
+from main import simulate
+from config import Config
+
+SPACING = 2
+
+def make_grid(grid_size):
+    '''
+    Retrieve the intersections of a full grid_size x grid_size grid.
+    '''
+    return [(i * SPACING, j * SPACING) for i in range(grid_size) for j in range(grid_size)]
+
+def make_config(grid_size, fleet_size, rate):
+    '''
+    Retrieve a Config on a synthetic grid, with fleet_size drivers spread over the three shifts of Config
+    and a constant Poisson rate per intersection and hour.
+    '''
+    config = Config(waiting_time_threshold=24)
+    config.intersections = make_grid(grid_size)
+    config.init_pos = ((grid_size // 2) * SPACING, (grid_size // 2) * SPACING)
+    config.city_lambd_schedule = [(0, 24, rate)]
+    daily_shifts = [[(3, 13)], [(9, 19)], [(18, 28)]]
+    config.driver_schedules = daily_schedules_to_weekly_schedules([daily_shifts[k % 3] for k in range(fleet_size)])
+    return config
+
+def sample_edge_poses(city_graph, num_poses, rng):
+    '''
+    Sample positions uniformly on the streets.
+    '''
+    edges = [city_graph.edge_poses[k] for k in rng.integers(len(city_graph.edge_poses), size=num_poses)]
+    ratios = rng.random(num_poses)
+    return [(u[0] + ratio * (v[0] - u[0]), u[1] + ratio * (v[1] - u[1])) for (u, v), ratio in zip(edges, ratios)]
+
+def measure(func, repeat):
+    '''
+    Retrieve the median wall time of func over repeat runs, func returns the number of operations it has done.
+    '''
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ops = func()
+        seconds.append(time.perf_counter() - start)
+    return float(np.median(seconds)), ops
+
+def bench_graph_build(grid_size):
+    intersections = make_grid(grid_size)
+    def run():
+        CityGraph(intersections)
+        return 1
+    return run
+
+def bench_pos_shortest_distance(grid_size, num_queries=2000):
+    rng = np.random.default_rng(0)
+    city_graph = CityGraph(make_grid(grid_size))
+    starts = sample_edge_poses(city_graph, num_queries, rng)
+    ends = sample_edge_poses(city_graph, num_queries, rng)
+    def run():
+        for start, end in zip(starts, ends):
+            city_graph.get_pos_shortest_distance(start, end)
+        return num_queries
+    return run
+
+def bench_poses_on_distance(grid_size, num_queries=500):
+    rng = np.random.default_rng(0)
+    city_graph = CityGraph(make_grid(grid_size))
+    nodes = rng.integers(grid_size * grid_size, size=num_queries).tolist()
+    distances = rng.uniform(0.5, 4.0, size=num_queries).tolist()
+    def run():
+        for node, distance in zip(nodes, distances):
+            city_graph.get_poses_on_distance(node, distance)
+        return num_queries
+    return run
+
+def bench_timeline_is_valid(num_events=5000, num_queries=20000):
+    rng = np.random.default_rng(0)
+    timeline = TimeLine()
+    for k in range(num_events):
+        timeline.add_event(TimeLineEvent(2 * k, 2 * k + 1, 'Call'))
+    starts = rng.uniform(0, 2 * num_events, size=num_queries).tolist()
+    events = [TimeLineEvent(start, start + 0.5, 'Call') for start in starts]
+    def run():
+        for e in events:
+            timeline.is_valid(e)
+        return num_queries
+    return run
+
+def bench_generate_plan(grid_size, fleet_size, num_calls=200):
+    rng = np.random.default_rng(0)
+    config = make_config(grid_size, fleet_size, 1.0)
+    city_graph = CityGraph(config.intersections)
+    drivers = []
+    for idx, schedule in enumerate(config.driver_schedules):
+        driver = TaxiDriver(idx=idx, init_pos=config.init_pos, city_graph=city_graph, rng=idx)
+        for start_time, end_time in schedule:
+            driver.add_shift(start_time, end_time)
+        drivers.append(driver)
+    calls = [CustomerCall(start, end, t) for start, end, t in zip(sample_edge_poses(city_graph, num_calls, rng), sample_edge_poses(city_graph, num_calls, rng),
+                                                                    np.sort(rng.uniform(0, 24, size=num_calls)).tolist())]
+    def run():
+        for call in calls:
+            for driver in drivers:
+                driver.generate_plan(call)
+        return num_calls * len(drivers)
+    return run
+
+def bench_allocate(grid_size, fleet_size, rate):
+    config = make_config(grid_size, fleet_size, rate)
+    city = City(config.intersections, initial_hour=0, lambd_schedule=config.city_lambd_schedule, rng=0)
+    # A day of calls, allocated by fresh coordinators
+    customer_calls = [city.step() for _ in range(24)]
+    def run():
+        coordinator = TaxiCoordinator(city=city, auction_type='second-price', payment_rule='type-1', bidding_strategy='truthful',
+                                        drivers_schedule=config.driver_schedules, init_pos=config.init_pos,
+                                        waiting_time_threshold=config.waiting_time_threshold, rng=0)
+        for calls in customer_calls:
+            coordinator.allocate(calls)
+        return sum(len(calls) for calls in customer_calls)
+    return run
+
+def bench_day(grid_size, fleet_size, rate):
+    config = make_config(grid_size, fleet_size, rate)
+    city_graph = CityGraph(config.intersections)
+    def run():
+        coordinator = simulate(config, 'second-price', 'type-1', 'truthful', 24, city_graph=city_graph, seed=0)
+        return sum(len(calls) for calls, _ in coordinator.history_call_batches)
+    return run
+
+# name: (benchmark factory, parameters it varies over)
+BENCHMARKS = {
+    'graph_build': (bench_graph_build, ['grid_size']),
+    'pos_shortest_distance': (bench_pos_shortest_distance, ['grid_size']),
+    'poses_on_distance': (bench_poses_on_distance, ['grid_size']),
+    'timeline_is_valid': (bench_timeline_is_valid, []),
+    'generate_plan': (bench_generate_plan, ['grid_size', 'fleet_size']),
+    'allocate': (bench_allocate, ['grid_size', 'fleet_size', 'rate']),
+    'day': (bench_day, ['grid_size', 'fleet_size', 'rate']),
+}
+
+def run_benchmarks(names, grid_sizes, fleet_sizes, rates, repeat):
+    '''
+    Run the benchmarks over the product of the parameters they vary over.
+    Return a list of {'name', 'params', 'seconds', 'ops', 'seconds_per_op'}.
+    '''
+    space = {'grid_size': grid_sizes, 'fleet_size': fleet_sizes, 'rate': rates}
+    results = []
+    for name in names:
+        factory, param_names = BENCHMARKS[name]
+        for values in itertools.product(*[space[param_name] for param_name in param_names]):
+            params = dict(zip(param_names, values))
+            seconds, ops = measure(factory(**params), repeat)
+            results.append({'name': name, 'params': params, 'seconds': seconds, 'ops': ops, 'seconds_per_op': seconds / ops})
+            print('{} {}: {:.4f}s ({:.2f} us/op)'.format(name, params, seconds, 1e6 * seconds / ops))
+    return results
+
+def get_result_key(result):
+    return (result['name'], tuple(sorted(result['params'].items())))
+
+def compare(results, baseline_results):
+    '''
+    Retrieve rows [name, params, baseline us/op, us/op, speedup] of the results also in the baseline.
+    '''
+    baseline = {get_result_key(result): result for result in baseline_results}
+    rows = []
+    for result in results:
+        base = baseline.get(get_result_key(result))
+        if base is not None:
+            rows.append([result['name'], result['params'], 1e6 * base['seconds_per_op'], 1e6 * result['seconds_per_op'],
+                            base['seconds_per_op'] / result['seconds_per_op']])
+    return rows
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--benchmarks', help='Benchmarks to run', type=str, nargs='+', choices=list(BENCHMARKS.keys()), default=list(BENCHMARKS.keys()))
+    parser.add_argument('--grid-sizes', help='Sizes of the synthetic square grids (intersections per side)', type=int, nargs='+', default=[6, 12])
+    parser.add_argument('--fleet-sizes', help='Numbers of drivers', type=int, nargs='+', default=[12, 48])
+    parser.add_argument('--rates', help='Poisson rates (calls per intersection and hour)', type=float, nargs='+', default=[1.0, 3.0])
+    parser.add_argument('--repeat', help='Runs of each benchmark, the median is reported', type=int, default=3)
+    parser.add_argument('--quick', help='Smallest parameters and a single run', action='store_true', default=False)
+    parser.add_argument('--output', help='Write the results to this JSON file', type=str, default=None)
+    parser.add_argument('--baseline', help='Compare with the results of this JSON file', type=str, default=None)
+    args = parser.parse_args()
+
+    if args.quick:
+        args.grid_sizes, args.fleet_sizes, args.rates, args.repeat = args.grid_sizes[:1], args.fleet_sizes[:1], args.rates[:1], 1
+
+    results = run_benchmarks(args.benchmarks, args.grid_sizes, args.fleet_sizes, args.rates, args.repeat)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({'python': platform.python_version(), 'numpy': np.__version__, 'results': results}, f, indent=1)
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as f:
+            baseline_results = json.load(f)['results']
+        print(tabulate(compare(results, baseline_results),
+                headers=['Benchmark', 'Parameters', 'Baseline (us/op)', 'Current (us/op)', 'Speedup']))
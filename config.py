@@ -1,4 +1,5 @@
 import copy
+import os
 
 from util.common import daily_schedules_to_weekly_schedules
 
@@ -14,6 +15,9 @@ class Config(object):
         ]
         self.init_pos = (4, 8)
 
+        # on-disk cache of the city graph matrices
+        self.graph_cache_dir = os.path.join('data', 'graph-cache')
+
         # schedule of city lambda value
         self.city_lambd_schedule = [(7, 9, 3.0), (17, 19, 3.0), (9, 17, 2.0), (19, 23, 2.0)]
 
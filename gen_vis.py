@@ -1,6 +1,8 @@
 import json
 import numpy as np
 
+from util.timeline import EVENT_NAMES, load_packed, get_packed_driver_events
+
 def compute_timings(start_time, route, speed):
     timings = [start_time]
     base_time = start_time
@@ -11,17 +13,112 @@ def compute_timings(start_time, route, speed):
         elapsed_time = dist / speed
         timing = base_time + elapsed_time
         timings.append(timing)
+        base_time = timing
+        prev_pos = pos
     return timings
 
-def compute(route, timings, t):            
-    prev_pos, prev_timing = route[0], timings[0]
-    for pos, timing in zip(route[1:], timings[1:]):
-        if t >= prev_timing and t <= timing:
-            ratio = (t - prev_timing) / (timing - prev_timing)            
-            offset = (pos[0] - prev_pos[0], pos[1] - prev_pos[1])
-            interp_pos = (prev_pos[0] + ratio * offset[0], prev_pos[1] + ratio * offset[1])
-            return interp_pos
-        prev_pos = pos
-        prev_timing = timing
-    return route[-1]
-       
+def load_packed_schedules(path):
+    '''
+    Load the packed schedules of all drivers (see util.timeline.dump_packed) as lists of event dicts, like the JSON dumps.
+    '''
+    events, routes = load_packed(path)
+    num_drivers = int(events['driver'].max()) + 1 if len(events) > 0 else 0
+    schedules = []
+    for driver in range(num_drivers):
+        driver_events = get_packed_driver_events(events, driver)
+        schedule = []
+        for start_time, end_time, event_type, route_offset, route_length in zip(driver_events['start_time'].tolist(), driver_events['end_time'].tolist(),
+                                                                                driver_events['event_type'].tolist(), driver_events['route_offset'].tolist(),
+                                                                                driver_events['route_length'].tolist()):
+            route = routes[route_offset:route_offset + route_length].tolist() if route_length > 0 else None
+            schedule.append({'start_time': start_time, 'end_time': end_time, 'event_name': EVENT_NAMES[event_type], 'route': route})
+        schedules.append(schedule)
+    return schedules
+
+# States of a car in a Playback
+STATE_FREE = 0
+STATE_SHIFT = 1
+STATE_DRIVING = 2
+
+class Playback(object):
+    '''
+    Positions of all cars over time. The schedules are turned once into linear segments (a route leg of a Call or a Return,
+    or a car standing still), the segment of every car at a time is found with one searchsorted and the positions are
+    interpolated for all cars at once.
+    '''
+    def __init__(self, schedules, speed, init_pos=(4, 8)):
+        '''
+        schedules: list of schedules (lists of event dicts, as dumped) of the cars
+        '''
+        self.num_cars = len(schedules)
+        starts, p0s, p1s, durations, states, cars = [], [], [], [], [], []
+        for car, schedule in enumerate(schedules):
+            pos = init_pos
+            for s in schedule:
+                event_name = s['event_name']
+                if event_name == 'Call' or event_name == 'Return':
+                    route = s['route']
+                    timings = compute_timings(s['start_time'], route, speed)
+                    for k in range(len(route) - 1):
+                        starts.append(timings[k]); durations.append(timings[k + 1] - timings[k])
+                        p0s.append(route[k]); p1s.append(route[k + 1]); states.append(STATE_DRIVING); cars.append(car)
+                    pos = route[-1]
+                else:
+                    if event_name == 'Shift':
+                        pos = init_pos
+                    starts.append(s['start_time']); durations.append(0.0)
+                    p0s.append(pos); p1s.append(pos)
+                    states.append(STATE_SHIFT if event_name == 'Shift' else STATE_FREE); cars.append(car)
+        self.starts = np.asarray(starts, dtype=np.float64)
+        self.durations = np.asarray(durations, dtype=np.float64)
+        self.p0s = np.asarray(p0s, dtype=np.float64).reshape(-1, 2)
+        self.p1s = np.asarray(p1s, dtype=np.float64).reshape(-1, 2)
+        self.states = np.asarray(states, dtype=np.int8)
+        cars = np.asarray(cars, dtype=np.int64)
+
+        # Segments are sorted by car then start time, shifting each car's times by car * span sorts them all in one key
+        self.min_start = self.starts.min() if len(self.starts) > 0 else 0.0
+        self.max_start = self.starts.max() if len(self.starts) > 0 else 0.0
+        self.span = self.max_start - self.min_start + 1.0
+        self.keys = self.starts + cars * self.span
+        self.car_offsets = np.searchsorted(cars, np.arange(self.num_cars + 1))
+        self.init_poses = np.tile(np.asarray(init_pos, dtype=np.float64), (self.num_cars, 1))
+
+    def update(self, t):
+        '''
+        Retrieve the positions (num_cars, 2) and the states (num_cars,) of all cars at time t.
+        '''
+        # A car stays at the start of its first segment before it and at the end of its last segment after it
+        query = np.clip(t, self.min_start, self.max_start) + np.arange(self.num_cars) * self.span
+        idx = np.maximum(np.searchsorted(self.keys, query, side='right') - 1, self.car_offsets[:-1])
+        # Cars without any segment stay at init_pos
+        valid = idx < self.car_offsets[1:]
+        if not valid.all():
+            poses, states = self.init_poses.copy(), np.full(self.num_cars, STATE_FREE, dtype=np.int8)
+            if valid.any():
+                poses[valid], states[valid] = self._interpolate(t, idx[valid])
+            return poses, states
+        return self._interpolate(t, idx)
+
+    def _interpolate(self, t, idx):
+        durations = self.durations[idx]
+        ratios = np.clip((t - self.starts[idx]) / np.where(durations > 0, durations, 1.0), 0.0, 1.0)
+        poses = self.p0s[idx] + ratios[:, None] * (self.p1s[idx] - self.p0s[idx])
+        return poses, self.states[idx]
+
+class CallStream(object):
+    '''
+    Customers' calls sorted by time, the calls around a time are found with bisects.
+    '''
+    def __init__(self, calls):
+        self.times = np.asarray([call['time'] for call in calls], dtype=np.float64)
+        self.start_poses = np.asarray([call['start_pos'] for call in calls], dtype=np.float64).reshape(-1, 2)
+        self.accepts = np.asarray([call['accept'] for call in calls], dtype=bool)
+
+    def get_range(self, t, eps):
+        '''
+        Retrieve the slice of the calls with abs(time - t) < eps.
+        '''
+        lo = np.searchsorted(self.times, t - eps, side='right')
+        hi = np.searchsorted(self.times, t + eps, side='left')
+        return slice(lo, hi)
@@ -1,73 +1,99 @@
 import logging
 import os
 import argparse
+import cProfile
 import numpy as np
 
 from tabulate import tabulate
 
 from simulator.city import City
+from simulator.call_trace import CallTraceRecorder, ReplayCity
+from simulator.event_clock import EventClock
 from simulator.customer_call import CustomerCall
 
 from auction.taxi_coordinator import TaxiCoordinator
 
 from util.common import compute_route_distance
+from util.event_log import EventLog
+from util.timeline import dump_packed
+from util import profiling
 
 from config import Config
 
 FORMAT = '[%(asctime)s %(filename)s:%(lineno)d] %(levelname)s: %(message)s'
 SHIFTS = ['3AM-1PM', '9AM-7PM', '6PM-4AM']
 
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-    parser.add_argument('--auction-type', help='Auction type of taxi coordinator', type=str, choices=['first-price', 'second-price'], required=True)
-    parser.add_argument('--payment-rule', help='Payment computation rule', type=str, choices=['type-1', 'type-2', 'type-3'], required=True)
-    parser.add_argument('--bidding-strategy', help='Bidding strategy of taxi drivers', type=str, choices=['truthful', 'shade', 'lookahead'], default='truthful')
-    parser.add_argument('--timelimit', help='Simulation timelimit (hour_simulation)', type=int, default=24)
-    parser.add_argument('--payment-ratio', help='Payment ratio', type=float, default=0.3)
-    parser.add_argument('--waiting-time-threshold', help='Waiting time threshold (hour_simulation)', type=float, default=24)
-    parser.add_argument('--dump', help='Dump the drivers\' schedules to JSON', action='store_true', default=False)
-    parser.add_argument('--verbose', help='Show log', type=str, choices=['info', 'debug'], default=None)
-    args = parser.parse_args()
-    
-    level = logging.ERROR
-    if args.verbose == 'info':
-        level = logging.INFO
-    elif args.verbose == 'debug':       
-        level = logging.DEBUG
-
-    logging.basicConfig(format=FORMAT, level=level, datefmt='%d-%m-%Y:%H:%M:%S')
-
-    config = Config(waiting_time_threshold=args.waiting_time_threshold, payment_ratio=args.payment_ratio)
-    city = City(config.intersections, initial_hour=0, lambd_schedule=config.city_lambd_schedule)
+def simulate(config, auction_type, payment_rule, bidding_strategy, timelimit, graph_cache_dir=None, city_graph=None, seed=None,
+                record_trace=None, replay_trace=None, event_log=None, clock='hour', joint_training=False,
+                async_training=False, policy_checkpoint=None, inference_only=False):
+    '''
+    Run the auction for timelimit hours of simulation, return the coordinator.
+    seed: int or numpy SeedSequence, the city and the coordinator get independent child streams (None: fresh entropy)
+    record_trace: path to record the customers' calls to
+    replay_trace: CallTrace or path of a trace to read the customers' calls from, instead of sampling them
+    event_log: path of the event log the allocations are streamed to, instead of the in-memory histories
+    clock: 'hour' to allocate the calls hour by hour, 'event' to run a simulator.event_clock.EventClock
+    joint_training: update the lookahead policy once with all drivers' experience, see TaxiCoordinator
+    async_training: train the lookahead policy in a background thread, the runs are not reproducible
+    policy_checkpoint: path of a saved lookahead policy to start from
+    inference_only: bid with the lookahead policy without collecting experience or training it
+    '''
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    city_seed, coordinator_seed = seed.spawn(2)
+    if replay_trace is not None:
+        city = ReplayCity(replay_trace, config.intersections, initial_hour=0, graph_cache_dir=graph_cache_dir, city_graph=city_graph)
+    else:
+        city = City(config.intersections, initial_hour=0, lambd_schedule=config.city_lambd_schedule, graph_cache_dir=graph_cache_dir, city_graph=city_graph,
+                    rng=city_seed)
+    recorder = CallTraceRecorder(record_trace) if record_trace is not None else None
+    event_log = EventLog(event_log) if event_log is not None else None
     coordinator = TaxiCoordinator(city=city, 
-                auction_type=args.auction_type,
-                payment_rule=args.payment_rule,
-                bidding_strategy=args.bidding_strategy,
+                auction_type=auction_type,
+                payment_rule=payment_rule,
+                bidding_strategy=bidding_strategy,
                 drivers_schedule=config.driver_schedules,
                 init_pos=config.init_pos,
                 payment_ratio=config.payment_ratio,
                 driving_velocity=config.driving_velocity,
                 charge_rate_per_kilometer=config.charge_rate_per_kilometer,
                 gas_cost_per_kilometer=config.gas_cost_per_kilometer,
-                waiting_time_threshold=config.waiting_time_threshold)
+                waiting_time_threshold=config.waiting_time_threshold,
+                rng=coordinator_seed,
+                event_log=event_log,
+                joint_training=joint_training,
+                async_training=async_training,
+                policy_checkpoint=policy_checkpoint,
+                inference_only=inference_only)
 
-    while city.time_sys.hour_in_sim() < args.timelimit:
-        customer_calls = city.step()         
-        coordinator.allocate(customer_calls)
-        if args.bidding_strategy == 'lookahead' and city.time_sys.hour_in_sim() % 8 == 0:
-            coordinator.train()
-            logging.info('Update the lookahead policy.')
+    train = (bidding_strategy == 'lookahead' and not inference_only)
+    if clock == 'event':
+        EventClock(city, coordinator, timelimit, train_interval=8 if train else None,
+                    on_calls=recorder.record if recorder is not None else None).run()
+    else:
+        while city.time_sys.hour_in_sim() < timelimit:
+            customer_calls = city.step()         
+            if recorder is not None:
+                recorder.record(customer_calls)
+            with profiling.timer('coordinator.allocate'):
+                coordinator.allocate(customer_calls)
+            if train and city.time_sys.hour_in_sim() % 8 == 0:
+                coordinator.train()
+                logging.info('Update the lookahead policy.')
+    coordinator.close()
+    if recorder is not None:
+        recorder.close()
+    if event_log is not None:
+        event_log.close()
+    return coordinator
 
-    if args.dump:        
-        coordinator.dump_history_payoff(os.path.join('data', 'company-history-payoff.npy'))
-    if args.dump:
-        coordinator.dump_history_calls_json(os.path.join('data', 'history-calls.json'))
-        
-    # Print driver status
-    print('===Drivers===')
+def get_driver_stats(coordinator, config, timelimit):
+    '''
+    Retrieve a row [shift, ID, acc. payoff, avg. payoff, avg. waiting time, return cost] per driver.
+    '''
     stats_drivers = []
     for driver in coordinator.drivers:        
-        events = driver.generate_complete_schedule(args.timelimit).events
+        events = driver.generate_complete_schedule(timelimit).events
         distance_return = 0
         for e in events:
             if e.event_name == 'Return':
@@ -79,22 +105,99 @@ if __name__ == '__main__':
         payoff_avg = payoff_sum / len(history_payoff_driver) if len(history_payoff_driver) > 0 else payoff_sum
         waiting_time_period_avg = driver.get_waiting_time_periods().mean()
         stats_drivers.append([shift, driver.idx, payoff_sum, payoff_avg, waiting_time_period_avg, cost_return])
-        if args.dump:
-            relative = False
-            driver.generate_complete_schedule(args.timelimit, relative).dump_json(os.path.join('data', 'driver-relative-%d-%03d.json' % (relative, driver.idx)))
-    print(tabulate(stats_drivers, 
-            headers=['Shift', 'ID', 'Acc. payoff', 'Avg. payoff', 'Avg. waiting time (hours)', 'Return cost']))
+    return stats_drivers
 
-    # Print company's status
+def get_company_stats(coordinator):
+    '''
+    Retrieve the row [acc. payoff, avg. payoff, avg. waiting time] of the company.
+    '''
     history_payoff = coordinator.get_history_payoff()
     all_waiting_time_periods = []
     for waiting_time_periods in [driver.get_waiting_time_periods() for driver in coordinator.drivers]:
         for t in waiting_time_periods:
             all_waiting_time_periods.append(t)
     all_waiting_time_periods = np.asarray(all_waiting_time_periods)
-    stats_company = [[history_payoff.sum(), history_payoff.mean(), all_waiting_time_periods.mean()]]
+    return [history_payoff.sum(), history_payoff.mean(), all_waiting_time_periods.mean()]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--auction-type', help='Auction type of taxi coordinator', type=str, choices=['first-price', 'second-price'], required=True)
+    parser.add_argument('--payment-rule', help='Payment computation rule', type=str, choices=['type-1', 'type-2', 'type-3'], required=True)
+    parser.add_argument('--bidding-strategy', help='Bidding strategy of taxi drivers', type=str, choices=['truthful', 'shade', 'lookahead'], default='truthful')
+    parser.add_argument('--timelimit', help='Simulation timelimit (hour_simulation)', type=int, default=24)
+    parser.add_argument('--payment-ratio', help='Payment ratio', type=float, default=0.3)
+    parser.add_argument('--waiting-time-threshold', help='Waiting time threshold (hour_simulation)', type=float, default=24)
+    parser.add_argument('--dump', help='Dump the drivers\' schedules', action='store_true', default=False)
+    parser.add_argument('--dump-format', help='Format of the drivers\' schedules, one JSON per driver or packed arrays of all drivers in data/schedules',
+                        type=str, choices=['json', 'packed'], default='json')
+    parser.add_argument('--verbose', help='Show log', type=str, choices=['info', 'debug'], default=None)
+    parser.add_argument('--seed', help='Random seed, runs with the same seed are identical (default: fresh entropy)', type=int, default=None)
+    parser.add_argument('--record-trace', help='Record the customers\' calls to a trace directory', type=str, default=None)
+    parser.add_argument('--replay-trace', help='Replay the customers\' calls of a recorded trace directory', type=str, default=None)
+    parser.add_argument('--event-log', help='Stream the allocations to a binary event log instead of keeping them in memory', type=str, default=None)
+    parser.add_argument('--clock', help='Step the simulation hour by hour or jump between events', type=str, choices=['hour', 'event'], default='hour')
+    parser.add_argument('--joint-training', help='Update the lookahead policy once with the experience of all drivers', action='store_true', default=False)
+    parser.add_argument('--async-training', help='Train the lookahead policy in a background thread instead of blocking the allocation', action='store_true', default=False)
+    parser.add_argument('--load-policy', help='Start the lookahead policy from this checkpoint', type=str, default=None)
+    parser.add_argument('--save-policy', help='Save the lookahead policy to this checkpoint at the end', type=str, default=None)
+    parser.add_argument('--inference-only', help='Bid with the lookahead policy without collecting experience or training it', action='store_true', default=False)
+    parser.add_argument('--profile', help='Print the time spent in each stage and the throughput', action='store_true', default=False)
+    parser.add_argument('--profile-output', help='Write cProfile stats of the simulation to this file (see pstats)', type=str, default=None)
+    parser.add_argument('--no-graph-cache', help='Do not read/write the city graph cache', action='store_true', default=False)
+    args = parser.parse_args()
+    
+    level = logging.ERROR
+    if args.verbose == 'info':
+        level = logging.INFO
+    elif args.verbose == 'debug':       
+        level = logging.DEBUG
+
+    logging.basicConfig(format=FORMAT, level=level, datefmt='%d-%m-%Y:%H:%M:%S')
+
+    config = Config(waiting_time_threshold=args.waiting_time_threshold, payment_ratio=args.payment_ratio)
+    graph_cache_dir = None if args.no_graph_cache else config.graph_cache_dir
+    if args.profile:
+        profiler = profiling.enable()
+    if args.profile_output is not None:
+        c_profiler = cProfile.Profile()
+        c_profiler.enable()
+    coordinator = simulate(config, args.auction_type, args.payment_rule, args.bidding_strategy, args.timelimit, graph_cache_dir=graph_cache_dir, seed=args.seed,
+                record_trace=args.record_trace, replay_trace=args.replay_trace, event_log=args.event_log,
+                clock=args.clock, joint_training=args.joint_training,
+                async_training=args.async_training, policy_checkpoint=args.load_policy, inference_only=args.inference_only)
+    if args.profile:
+        profiler.stop()
+    if args.profile_output is not None:
+        c_profiler.disable()
+        c_profiler.dump_stats(args.profile_output)
+    if args.save_policy is not None:
+        coordinator.save_policy(args.save_policy)
+
+    if args.dump:        
+        coordinator.dump_history_payoff(os.path.join('data', 'company-history-payoff.npy'))
+        coordinator.dump_history_calls_json(os.path.join('data', 'history-calls.json'))
+        relative = False
+        if args.dump_format == 'packed':
+            dump_packed(os.path.join('data', 'schedules'), [driver.generate_complete_schedule(args.timelimit, relative) for driver in coordinator.drivers])
+        else:
+            for driver in coordinator.drivers:
+                driver.generate_complete_schedule(args.timelimit, relative).dump_json(os.path.join('data', 'driver-relative-%d-%03d.json' % (relative, driver.idx)))
+
+    # Print driver status
+    print('===Drivers===')
+    print(tabulate(get_driver_stats(coordinator, config, args.timelimit), 
+            headers=['Shift', 'ID', 'Acc. payoff', 'Avg. payoff', 'Avg. waiting time (hours)', 'Return cost']))
+
+    # Print company's status
     print('===Company===')
-    print(tabulate(stats_company, 
+    print(tabulate([get_company_stats(coordinator)], 
             headers=['Acc. payoff', 'Avg. payoff', 'Avg. waiting time (hours)']))
 
- 
+    if args.profile:
+        print('===Profile===')
+        print(tabulate(profiler.get_stage_stats(),
+                headers=['Stage', 'Runs', 'Total (s)', '% of wall time', 'Avg. (us)']))
+        calls_per_sec = profiler.get_throughput('calls', 'coordinator.allocate')
+        plans_per_sec = profiler.get_throughput('plans', 'coordinator.plans')
+        print(tabulate([[profiler.get_wall_time(), profiler.counters['calls'], calls_per_sec, profiler.counters['plans'], plans_per_sec]],
+                headers=['Wall time (s)', 'Calls', 'Calls/sec', 'Plans', 'Plans/sec']))
@@ -0,0 +1,73 @@
+import os
+# Render without a display, before pygame is imported
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import argparse
+import shutil
+import subprocess
+import numpy as np
+import pygame
+
+from concurrent.futures import ProcessPoolExecutor
+
+import vis
+
+FRAME_NAME = 'frame-%06d.png'
+
+# State of a worker process, set by _init_worker
+_worker = {}
+
+def _init_worker(data_dir, schedule_format):
+    pygame.init()
+    _worker['surface'] = pygame.Surface(vis.SCREEN_SIZE)
+    _worker['background'] = vis.load_grid().make_background()
+    _worker['playback'], _worker['calls'] = vis.load_replay(data_dir, schedule_format)
+
+def _render_frames(frames, times, output_dir):
+    surface = _worker['surface']
+    for frame, t in zip(frames, times):
+        vis.draw_frame(surface, _worker['background'], t, _worker['playback'], _worker['calls'])
+        pygame.image.save(surface, os.path.join(output_dir, FRAME_NAME % frame))
+    return len(frames)
+
+def render(data_dir, output_dir, timelimit, step=vis.SPEED / 30.0, num_workers=None, chunk_size=64, schedule_format='json'):
+    '''
+    Render the frames of the run dumped in data_dir from 0 to timelimit (hour_simulation), one frame every step,
+    to output_dir in a pool of num_workers processes. Return the number of frames.
+    schedule_format: format of the dumped schedules, see vis.load_replay
+    '''
+    os.makedirs(output_dir, exist_ok=True)
+    times = np.arange(0, timelimit, step)
+    frames = np.arange(len(times))
+    with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker, initargs=(data_dir, schedule_format)) as executor:
+        futures = [executor.submit(_render_frames, frames[k:k + chunk_size].tolist(), times[k:k + chunk_size].tolist(), output_dir)
+                    for k in range(0, len(frames), chunk_size)]
+        num_frames = sum(future.result() for future in futures)
+    return num_frames
+
+def encode_video(output_dir, video_path, fps):
+    '''
+    Encode the frames of output_dir with ffmpeg.
+    '''
+    if shutil.which('ffmpeg') is None:
+        raise Exception('error: ffmpeg is not found, the frames are in {}'.format(output_dir))
+    subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-framerate', str(fps), '-i', os.path.join(output_dir, FRAME_NAME),
+                    '-pix_fmt', 'yuv420p', video_path], check=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--data-dir', help='Directory of the dumped run (main.py --dump)', type=str, default='data')
+    parser.add_argument('--schedule-format', help='Format of the dumped schedules (main.py --dump-format)', type=str, choices=['json', 'packed'], default='json')
+    parser.add_argument('--output-dir', help='Directory of the PNG frames', type=str, default=os.path.join('data', 'frames'))
+    parser.add_argument('--timelimit', help='Replay timelimit (hour_simulation)', type=float, default=24)
+    parser.add_argument('--step', help='Simulation time between frames (hour_simulation)', type=float, default=vis.SPEED / 30.0)
+    parser.add_argument('--workers', help='Number of worker processes', type=int, default=os.cpu_count())
+    parser.add_argument('--video', help='Encode the frames to this video file with ffmpeg', type=str, default=None)
+    parser.add_argument('--fps', help='Frame rate of the video', type=int, default=60)
+    args = parser.parse_args()
+
+    num_frames = render(args.data_dir, args.output_dir, args.timelimit, step=args.step, num_workers=args.workers, schedule_format=args.schedule_format)
+    print('Rendered {} frames to {}'.format(num_frames, args.output_dir))
+    if args.video is not None:
+        encode_video(args.output_dir, args.video, args.fps)
+        print('Encoded {}'.format(args.video))
@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+
+from simulator.city import City
+from simulator.customer_call import CustomerCallBatch
+
+# One .npy file per column of CustomerCallBatch
+TRACE_COLUMNS = ['times', 'start_x', 'start_y', 'destination_x', 'destination_y', 'start_node_ids']
+
+class CallTraceRecorder(object):
+    '''
+    Record the CustomerCallBatch of each step, written as a trace directory on close.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.batches = []
+
+    def record(self, customer_calls):
+        self.batches.append(customer_calls)
+
+    def close(self):
+        '''
+        Write the columns to a temporary directory and move it to path, replacing an older trace.
+        '''
+        batch = CustomerCallBatch.concatenate(self.batches) if len(self.batches) > 0 else CustomerCallBatch([], [], [], [], [], [])
+        if np.any(np.diff(batch.times) < 0):
+            raise Exception('error: recorded customer calls must be sorted by time.')
+        parent = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(parent, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(dir=parent)
+        for name in TRACE_COLUMNS:
+            np.save(os.path.join(tmp_path, name + '.npy'), getattr(batch, name))
+        if os.path.isdir(self.path):
+            shutil.rmtree(self.path)
+        os.rename(tmp_path, self.path)
+
+class CallTrace(object):
+    '''
+    A recorded trace, the columns are memory-mapped (read-only).
+    '''
+    def __init__(self, path):
+        self.path = path
+        if not os.path.isdir(path):
+            raise Exception('error: no call trace at {}'.format(path))
+        self.columns = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in TRACE_COLUMNS}
+        self.times = self.columns['times']
+
+    def __len__(self):
+        return len(self.times)
+
+    def get_calls(self, start_time, end_time):
+        '''
+        Retrieve the calls in [start_time, end_time) as a CustomerCallBatch.
+        '''
+        lo, hi = np.searchsorted(self.times, [start_time, end_time], side='left')
+        return CustomerCallBatch(*[np.asarray(self.columns[name][lo:hi]) for name in TRACE_COLUMNS])
+
+class ReplayCity(City):
+    '''
+    A City whose customers' calls are read hour by hour from a CallTrace instead of being sampled.
+    '''
+    def __init__(self, trace, intersections, initial_hour, graph_cache_dir=None, city_graph=None):
+        '''
+        trace: CallTrace or path of a trace directory
+        '''
+        super(ReplayCity, self).__init__(intersections, initial_hour, graph_cache_dir=graph_cache_dir, city_graph=city_graph)
+        self.trace = trace if isinstance(trace, CallTrace) else CallTrace(trace)
+
+    def generate_calls(self):
+        current_hour = self.time_sys.hour_in_sim()
+        return self.trace.get_calls(current_hour, current_hour + 1)
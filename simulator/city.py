@@ -3,22 +3,40 @@ from simulator.time_sys import TimeSystem
 from simulator.city_graph import CityGraph
 from simulator.city_customer_call_simulation import CityCustomerCallSimulation
 from simulator.customer_call import CustomerCall, CustomerCallJSONEncoder
+from util import profiling
  
 class City(object):
-    def __init__(self, intersections, initial_hour, lambd_schedule=[]):
+    def __init__(self, intersections, initial_hour, lambd_schedule=[], graph_cache_dir=None, city_graph=None, rng=None):
         '''
         intersections: specification of intersections
         initial_hour: initial time
         lambd_schedule: schedule of lambda in Poisson process
+        graph_cache_dir: directory of the city graph cache (None: no cache)
+        city_graph: prebuilt CityGraph of the intersections, shared between cities (None: build it)
+        rng: numpy Generator, seed or SeedSequence of the customers' calls (None: fresh entropy)
         '''
         self.intersections = intersections
         self.lambd_schedule = lambd_schedule
-        self.city_graph = CityGraph(self.intersections)
+        self.city_graph = city_graph if city_graph is not None else CityGraph(self.intersections, cache_dir=graph_cache_dir)
         self.time_sys = TimeSystem(initial_hour)
         
-        self.customer_call_sim = CityCustomerCallSimulation(self.intersections, self.city_graph, self.time_sys)
+        self.customer_call_sim = CityCustomerCallSimulation(self.intersections, self.city_graph, self.time_sys, rng=rng)
               
     def step(self):
+        '''
+        Generate the customers' calls of the current hour and move to the next hour.
+        '''
+        with profiling.timer('city.step'):
+            customer_calls = self.generate_calls()
+
+        # Accumulate the time
+        self.time_sys.step()
+        return customer_calls
+
+    def generate_calls(self):
+        '''
+        Generate the customers' calls of the current hour, sorted by time.
+        '''
         # Default lambd is 1.0
         self.customer_call_sim.set(lambd=1.0)
         current_hour_in_day = self.time_sys.hour_in_a_day()
@@ -27,14 +45,8 @@ class City(object):
                 self.customer_call_sim.set(lambd=lambd)
                 break     
 
-        # Generate customers' calls with the city_graph.
-        customer_calls = self.customer_call_sim()
-
-        # Accumulate the time
-        self.time_sys.step()
-
-        calls = sorted(customer_calls, key=lambda call: call.time)
-        return calls
+        # Generate customers' calls with the city_graph, already sorted by time.
+        return self.customer_call_sim()
 
     def time(self):
         return str(self.time_sys)
@@ -1,44 +1,51 @@
 import numpy as np
-import random
 
 from simulator.time_sys import TimeSystem
-from simulator.customer_call import CustomerCall
+from simulator.customer_call import CustomerCallBatch
 from util.distribution import NormalDistribution, PoissonProcess
+from util import profiling
 
 class CityCustomerCallSimulation(object):
-    def __init__(self, intersections, city_graph, time_sys):
+    def __init__(self, intersections, city_graph, time_sys, rng=None):
+        '''
+        rng: numpy Generator, seed or SeedSequence shared by all the samples of the calls (None: fresh entropy)
+        '''
+        self.rng = np.random.default_rng(rng)
         self.intersections = intersections
         self.city_graph = city_graph
         self.time_sys = time_sys
+        self.intersection_poses = np.asarray(intersections, dtype=np.float64)
+        self.start_node_ids = np.array([city_graph.get_id(intersection) for intersection in intersections], dtype=np.int32)
 
-        self.poisson_process = PoissonProcess()
-        self.normal_distribution = NormalDistribution(mu=2.0, sigma=1.5)
+        self.poisson_process = PoissonProcess(rng=self.rng)
+        self.normal_distribution = NormalDistribution(mu=2.0, sigma=1.5, rng=self.rng)
 
     def set(self, lambd):
         self.poisson_process.set(lambd)
 
     def __call__(self):
-        customer_calls = []
-        for intersection in self.intersections:
-            customer_calls += self._generate_customer_calls_at_intersection(intersection)
-        return customer_calls
-                      
-    def _generate_customer_calls_at_intersection(self, intersection):
-        start_node_idx = self.city_graph.get_id(intersection)
-        accumulated_time = 0
-        customer_calls = []
-        while True:
-            next_call_elapsed_time = self.poisson_process()
-            time = self.time_sys.hour_in_sim() + accumulated_time + next_call_elapsed_time 
-            travelling_distance = self.normal_distribution()
-            if travelling_distance <= 0:
-                raise Exception('Error: travelling distance must be larger than zero, distance = %f' % (travelling_distance))
-            possible_destinations = self.city_graph.get_poses_on_distance(start_node_idx, travelling_distance)
-            sampled_destination = random.choice(possible_destinations)            
-            customer_call = CustomerCall(intersection, sampled_destination, time)
-            accumulated_time += next_call_elapsed_time            
-            if accumulated_time >= 1:
-                break           
-            customer_calls.append(customer_call)
-        return customer_calls
+        '''
+        Generate the customers' calls of the next hour at all intersections as a CustomerCallBatch sorted by time.
+        '''
+        with profiling.timer('city.generate_calls'):
+            return self._generate()
 
+    def _generate(self):
+        intersection_ids, elapsed_times = self.poisson_process.sample_arrivals(len(self.intersections), duration=1)
+        times = self.time_sys.hour_in_sim() + elapsed_times
+        travelling_distances = self.normal_distribution(size=len(times))
+        if np.any(travelling_distances <= 0):
+            raise Exception('Error: travelling distance must be larger than zero, distance = %f' % (travelling_distances.min()))
+
+        # Pick one destination uniformly among the positions at the travelling distance
+        destination_samples = self.rng.random(size=len(times))
+
+        start_node_ids = self.start_node_ids[intersection_ids]
+        destination_poses = np.empty((len(times), 2))
+        for k, (start_node_idx, travelling_distance, u) in enumerate(zip(start_node_ids.tolist(), travelling_distances.tolist(), destination_samples.tolist())):
+            sampled_destination = self.city_graph.sample_pos_on_distance(start_node_idx, travelling_distance, u)
+            if sampled_destination is None:
+                raise Exception('Error: no destination at distance %f from %s' % (travelling_distance, str(self.city_graph.get_pos(start_node_idx))))
+            destination_poses[k] = sampled_destination
+        start_poses = self.intersection_poses[intersection_ids]
+        return CustomerCallBatch(times, start_poses[:, 0], start_poses[:, 1], destination_poses[:, 0], destination_poses[:, 1], start_node_ids)
@@ -1,11 +1,21 @@
+import bisect
+import hashlib
+import os
+import shutil
+import tempfile
 import numpy as np
 
-from collections import deque as Queue
+from collections import deque as Queue, namedtuple
 
 from util.graph import Graph
-from util.common import check_duplicated_element, movement_to_dir
+from util.common import check_duplicated_element
 from util.defines import INF
 
+# Street segments reachable from one source, segment k covers the distances [lows[k], highs[k]) from node_poses[k] along
+# directions[k]. Between breaks[b] and breaks[b + 1] the covering segments are segments[offsets[b]:offsets[b + 1]].
+DestinationTable = namedtuple('DestinationTable', ['lows', 'highs', 'lengths', 'neighbor_distances', 'node_poses', 'directions',
+                                                   'breaks', 'offsets', 'segments'])
+
 class CityGraph(Graph):
     DIRS =  [   (0, -1),# Left
                 (-1, 0),# Up
@@ -13,26 +23,30 @@ class CityGraph(Graph):
                 (1, 0)  # Down
             ]
 
-    def __init__(self, intersections):
+    # Bump when the content of the cached matrices changes
+    CACHE_VERSION = 2
+    CACHE_ARRAYS = ['adj_matrix', 'distance_matrix', 'predessor_matrix', 'next_hops', 'edges']
+
+    def __init__(self, intersections, method='auto', cache_dir=None, arrays=None):
+        '''
+        intersections: list of (i, j) positions, streets connect consecutive intersections on a row or a column
+        method: all-pairs shortest path engine, see util.graph.Graph
+        cache_dir: directory of the on-disk matrices cache, None to always build the matrices
+        arrays: prebuilt matrices by name (see get_arrays), e.g. in shared memory; used as is, without copy
+        '''
         # Check duplicated intersection
         if check_duplicated_element(intersections):
             raise Exception("Error: duplicated interscetion.")
 
         # Find boundary
-        min_i = min_j = INF
-        max_i = max_j = -INF
-        for pos in intersections:
-            if pos[0] < min_i: min_i = pos[0]
-            if pos[0] > max_i: max_i = pos[0]
-            if pos[1] < min_j: min_j = pos[1]        
-            if pos[1] > max_j: max_j = pos[1]     
-
-        # Check boundary
-        def _is_in_boundary(p):
-            return (p[0] >= min_i and p[0] <= max_i and p[1] >= min_j and p[1] <= max_j)
-        
+        min_i = min(pos[0] for pos in intersections)
+        max_i = max(pos[0] for pos in intersections)
+        min_j = min(pos[1] for pos in intersections)
+        max_j = max(pos[1] for pos in intersections)
+
         self.idx_table = {pos: idx for idx, pos in enumerate(intersections)}
         self.idx_to_pos_table = {idx: pos for pos, idx in self.idx_table.items()}
+        self.node_poses = [self.idx_to_pos_table[idx] for idx in range(len(intersections))]
         
         # Check bounds points
         if (min_i, min_j) not in self.idx_table or \
@@ -41,37 +55,116 @@ class CityGraph(Graph):
                 (max_i, max_j) not in self.idx_table:
             raise Exception("Error: invalid intersections list")
 
+        if arrays is not None:
+            self._set_arrays(arrays)
+        elif cache_dir is None:
+            self._build(intersections, method)
+        else:
+            cache_path = os.path.join(cache_dir, CityGraph.get_cache_key(intersections, method))
+            if os.path.isdir(cache_path):
+                self._load_cache(cache_path)
+            else:
+                self._build(intersections, method)
+                self._save_cache(cache_dir, cache_path)
+        self.edge_poses = [(self.get_pos(u), self.get_pos(v)) for u, v in self.edges]
+        self.edge_index = self._build_edge_index()
+        # Destination tables by source node, built on the first lookup
+        self.destination_tables = {}
+
+    @staticmethod
+    def get_cache_key(intersections, method='auto'):
+        '''
+        Retrieve the content hash of an intersections list, used as the name of its cache entry.
+        '''
+        h = hashlib.sha1()
+        h.update('v{}-{}'.format(CityGraph.CACHE_VERSION, method).encode())
+        h.update(np.asarray(intersections, dtype=np.float64).tobytes())
+        return h.hexdigest()
+
+    def get_arrays(self):
+        '''
+        Retrieve the matrices by name, the inverse of the arrays argument.
+        '''
+        return {'adj_matrix': self.adj_matrix,
+                'distance_matrix': self.distance_matrix,
+                'predessor_matrix': self.predessor_matrix,
+                'next_hops': self.next_hops,
+                'edges': np.asarray(self.edges, dtype=np.int32).reshape(-1, 2)}
+
+    def _set_arrays(self, arrays):
+        self.adj_matrix = arrays['adj_matrix']
+        self.distance_matrix = arrays['distance_matrix']
+        self.predessor_matrix = arrays['predessor_matrix']
+        self.next_hops = arrays['next_hops']
+        self.edges = [(int(u), int(v)) for u, v in arrays['edges']]
+
+    def _load_cache(self, cache_path):
+        '''
+        Memory-map the cached matrices (read-only).
+        '''
+        # Plain ndarray views of the maps, indexing a np.memmap is much slower
+        self._set_arrays({name: np.asarray(np.load(os.path.join(cache_path, name + '.npy'), mmap_mode='r')) for name in CityGraph.CACHE_ARRAYS})
+
+    def _save_cache(self, cache_dir, cache_path):
+        '''
+        Write the matrices to a temporary directory and move it to cache_path, so readers never see a partial entry.
+        '''
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(dir=cache_dir)
+        arrays = self.get_arrays()
+        for name in CityGraph.CACHE_ARRAYS:
+            np.save(os.path.join(tmp_path, name + '.npy'), arrays[name])
+        try:
+            os.rename(tmp_path, cache_path)
+        except OSError:
+            # Another process has written the same entry
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def _build(self, intersections, method):
+        '''
+        Build the adjacency matrix, the edges list and the shortest paths of the intersections.
+        '''
         num_vertex = len(self.idx_table)
         
         # Initialize the length of each edge as INF
         adj_matrix = np.zeros([num_vertex, num_vertex], dtype=np.int32)
         adj_matrix.fill(INF)       
-        
-        # Set the length of each edge in the adj_matrix according to the intersections
-        for pos in intersections:
-            current_pos_idx = self.idx_table[pos]
-            adj_matrix[current_pos_idx, current_pos_idx] = 0
-            for d in CityGraph.DIRS:
-                length = 1
-                next_pos = (pos[0] + d[0] * length, pos[1] + d[1] * length)
-                while _is_in_boundary(next_pos):
-                    if next_pos in self.idx_table:
-                        next_pos_idx = self.idx_table[next_pos]
-                        adj_matrix[current_pos_idx, next_pos_idx] = length
-                        break
-                    length += 1
-                    next_pos = (pos[0] + d[0] * length, pos[1] + d[1] * length)
+        np.fill_diagonal(adj_matrix, 0)
+
+        # Connect consecutive intersections on the same row / column
+        for axis in range(2):
+            lines = {}
+            for pos in intersections:
+                lines.setdefault(pos[axis], []).append(pos)
+            for line in lines.values():
+                line.sort(key=lambda pos: pos[1 - axis])
+                for pos, next_pos in zip(line[:-1], line[1:]):
+                    u, v = self.idx_table[pos], self.idx_table[next_pos]
+                    adj_matrix[u, v] = adj_matrix[v, u] = next_pos[1 - axis] - pos[1 - axis]
         self.adj_matrix = adj_matrix.copy()
 
         # Initialize the edges list
-        edges = []
-        for u in range(num_vertex):
-            for v in range(u, num_vertex):      
-                if u != v and self.adj_matrix[u, v] < INF:
-                    edges.append((u, v))
-        self.edges = edges
-        self.edge_poses = [(self.get_pos(u), self.get_pos(v)) for u, v in self.edges]
-        super(CityGraph, self).__init__(adj_matrix)
+        self.edges = [(int(u), int(v)) for u, v in np.argwhere(np.triu(self.adj_matrix < INF, k=1))]
+        super(CityGraph, self).__init__(adj_matrix, method=method)
+        self.next_hops = self._build_next_hops()
+
+    def _build_next_hops(self):
+        '''
+        Derive from the predecessor matrix the first node after u on the route from u to v, -1 if v is not reachable.
+        '''
+        num_vertex = len(self.predessor_matrix)
+        reachable = self.predessor_matrix != -INF
+        pred = np.where(reachable, self.predessor_matrix, 0).astype(np.int32)
+        # Climb each shortest path tree up to the children of its root by pointer jumping, in O(log(depth)) passes
+        hops = np.where(pred == np.arange(num_vertex, dtype=np.int32)[:, np.newaxis], np.arange(num_vertex, dtype=np.int32), pred)
+        np.fill_diagonal(hops, np.arange(num_vertex, dtype=np.int32))
+        while True:
+            next_hops = np.take_along_axis(hops, hops, axis=1)
+            if (next_hops == hops).all():
+                break
+            hops = next_hops
+        hops[~reachable] = -1
+        return hops
 
     def get_id(self, pos):
         '''
@@ -97,9 +190,17 @@ class CityGraph(Graph):
         '''
         Retrieve the shortest path a list of positions from node u to v
         '''
-        path = self.get_path(u, v)
+        u, v = int(u), int(v)
+        hops = self.next_hops[:, v]
+        if hops[u] < 0:
+            return [None]
+        # Each hop is strictly closer to v, the walk is O(path length)
+        path = [u]
+        while u != v:
+            u = int(hops[u])
+            path.append(u)
         if convert_to_pos:
-            return [self.get_pos(node) for node in path]
+            return [self.node_poses[node] for node in path]
         return path
 
     def get_pos_shortest_distance(self, pu, pv):
@@ -127,53 +228,97 @@ class CityGraph(Graph):
             return None        
 
         min_distance = INF
-        min_distance_idx = None
-        paths = []
-        cnt = 0
+        min_nodes = None
         for node_u in possible_node_u:        
+            distance_node_u_to_pos_u = self._get_node_to_neighbor_pos_distance(node_u, pu)
             for node_v in possible_node_v:
                 distance_node_u_to_node_v = self.get_shortest_distance(node_u, node_v)
-                distance_node_u_to_pos_u = self._get_node_to_neighbor_pos_distance(node_u, pu)
                 distance_node_v_to_pos_v = self._get_node_to_neighbor_pos_distance(node_v, pv)
                 total_distance = distance_node_u_to_pos_u + distance_node_u_to_node_v + distance_node_v_to_pos_v
                 if total_distance < min_distance:
                     min_distance = total_distance
-                    min_distance_idx = cnt
-                path_node_u_to_node_v = self.get_shortest_path(node_u, node_v, convert_to_pos=True)
-                path = path_node_u_to_node_v
-                if not u_is_node:
-                    path = [pu] + path
-                if not v_is_node:
-                    path = path + [pv]
-                paths.append(path)
-                cnt += 1
-        return min_distance, paths[min_distance_idx]
+                    min_nodes = (node_u, node_v)
+        # Only the route of the closest pair of end nodes is built
+        path = self.get_shortest_path(min_nodes[0], min_nodes[1], convert_to_pos=True)
+        if not u_is_node:
+            path = [pu] + path
+        if not v_is_node:
+            path = path + [pv]
+        return min_distance, path
 
     def get_poses_on_distance(self, start_node_idx, distance):
         '''
         Retrieve a list of positions of which distances to start_node equal to the given distance.
         '''
-        nodes = self.get_nodes_with_distance(start_node_idx, distance)
-        poses = []
-        for node in nodes:
-            # Check if it can find a position on the lines connected to start_node_idx
-            distance_to_node = self.get_shortest_distance(start_node_idx, node)
-            node_pos = self.get_pos(node)
-            residual_distance = distance - distance_to_node
-            neighbor_nodes, neighbor_node_distances = self._get_all_neighbor_nodes(node)
-            for neighbor_node, neighbor_node_distance in zip(neighbor_nodes, neighbor_node_distances):
-                if (residual_distance < neighbor_node_distance):
-                    neighbor_node_pos = self.get_pos(neighbor_node)
-                    relative_movement = (neighbor_node_pos[0] - node_pos[0], neighbor_node_pos[1] - node_pos[1])
-                    direction = movement_to_dir(relative_movement)                     
-                    pos = (node_pos[0] + direction[0] * residual_distance, node_pos[1] + direction[1] * residual_distance)                
-                    # Check if we can travel to pos with shorter distance from the other side
-                    distance_start_to_the_other_side = self.get_shortest_distance(start_node_idx, neighbor_node)
-                    distance_the_other_side_to_pos = distance_start_to_the_other_side + (neighbor_node_distance - residual_distance)
-                    if distance_to_node + residual_distance <= distance_the_other_side_to_pos:
-                        poses.append(pos)                        
-        return list(set(poses))
-    
+        table = self.get_destination_table(start_node_idx)
+        residual_distances = distance - table.lows
+        # A position is kept if it cannot be reached with shorter distance from the other side of its street
+        valid = (table.lows <= distance) & (residual_distances < table.lengths) & \
+                (table.lows + residual_distances <= table.neighbor_distances + (table.lengths - residual_distances))
+        poses = table.node_poses[valid] + table.directions[valid] * residual_distances[valid, np.newaxis]
+        return list(set(map(tuple, poses.tolist())))
+
+    def sample_pos_on_distance(self, start_node_idx, distance, u):
+        '''
+        Sample a position of which distance to start_node equals to the given distance, uniformly over the positions
+        of get_poses_on_distance. u is a uniform sample in [0, 1). Return None if there is no such position.
+        '''
+        table = self.get_destination_table(start_node_idx)
+        b = bisect.bisect_right(table.breaks, distance) - 1
+        if b < 0:
+            return None
+        if distance == table.breaks[b]:
+            # Segments end points may coincide, fall back to the deduplicated positions, also at the farthest distance
+            poses = self.get_poses_on_distance(start_node_idx, distance)
+            return poses[int(u * len(poses))] if len(poses) > 0 else None
+        if b >= len(table.breaks) - 1:
+            return None
+        start, end = table.offsets[b], table.offsets[b + 1]
+        k = table.segments[start + int(u * (end - start))]
+        residual_distance = distance - table.lows[k]
+        node_pos, direction = table.node_poses[k], table.directions[k]
+        return (float(node_pos[0] + direction[0] * residual_distance), float(node_pos[1] + direction[1] * residual_distance))
+
+    def get_destination_table(self, start_node_idx):
+        '''
+        Retrieve the DestinationTable of node start_node_idx.
+        '''
+        table = self.destination_tables.get(start_node_idx)
+        if table is None:
+            table = self._build_destination_table(start_node_idx)
+            self.destination_tables[start_node_idx] = table
+        return table
+
+    def _build_destination_table(self, start_node_idx):
+        '''
+        Cut every directed street (node -> neighbor) at the distance from which the other side is closer,
+        then index the covering segments of every interval between two segment end points.
+        '''
+        num_vertex = len(self.adj_matrix)
+        has_edge = (self.adj_matrix < INF) & ~np.eye(num_vertex, dtype=bool)
+        nodes, neighbor_nodes = np.nonzero(has_edge)
+        distances = self.distance_matrix[start_node_idx].astype(np.float64)
+        lengths = self.adj_matrix[nodes, neighbor_nodes].astype(np.float64)
+        lows = distances[nodes]
+        neighbor_distances = distances[neighbor_nodes]
+        highs = lows + np.minimum(lengths, (neighbor_distances + lengths - lows) / 2)
+        all_poses = np.array([self.get_pos(node) for node in range(num_vertex)], dtype=np.float64)
+        node_poses = all_poses[nodes]
+        directions = np.sign(all_poses[neighbor_nodes] - node_poses)
+
+        # Segment k covers the intervals [breaks[b], breaks[b + 1]) for b in [first[k], last[k])
+        breaks = np.unique(np.concatenate([lows, highs]))
+        first = np.searchsorted(breaks, lows)
+        last = np.searchsorted(breaks, highs)
+        counts = last - first
+        segments = np.repeat(np.arange(len(lows)), counts)
+        intervals = np.repeat(first - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        order = np.argsort(intervals, kind='stable')
+        offsets = np.zeros(len(breaks) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(intervals, minlength=len(breaks)))
+        return DestinationTable(lows, highs, lengths, neighbor_distances, node_poses, directions,
+                                breaks.tolist(), offsets.tolist(), segments[order].tolist())
+
     def get_nodes_with_distance(self, start_node_idx, distance):
         '''
         Retrieve a list of nodes of which distance to start_node is within the given distance.
@@ -196,24 +341,50 @@ class CityGraph(Graph):
                 neighbor_nodes_distance.append(self.adj_matrix[node_idx, v])
         return neighbor_nodes, neighbor_nodes_distance
 
-    def _get_edge_with_pos(self, pos):
-        for edge in self.edges:       
-            i0, j0 = self.get_pos(edge[0])
-            i1, j1 = self.get_pos(edge[1])
-            # Horizontal edge
-            if i0 == i1:
-                min_j = min(j0, j1)
-                max_j = max(j0, j1)
-                if pos[0] == i0 and (pos[1] < max_j and pos[1] > min_j):
-                    return list(edge)
-            # Vertical edge
-            elif j0 == j1:
-                min_i = min(i0, i1)
-                max_i = max(i0, i1)
-                if pos[1] == j0 and (pos[0] < max_i and pos[0] > min_i):
-                    return list(edge)
+    def _build_edge_index(self):
+        '''
+        Index the edges by their fixed coordinate: edge_index[axis][c] holds the sorted intervals of the edges lying on
+        the line pos[axis] == c as (starts, ends, edge ids).
+        '''
+        lines = [{}, {}]
+        for edge_id, (p0, p1) in enumerate(self.edge_poses):
+            # Horizontal edges lie on a row (axis 0), vertical edges on a column (axis 1)
+            if p0[0] == p1[0]:
+                axis = 0
+            elif p0[1] == p1[1]:
+                axis = 1
             else:
                 raise Exception('Error: invalid edge.')
+            start, end = sorted([p0[1 - axis], p1[1 - axis]])
+            lines[axis].setdefault(p0[axis], []).append((start, end, edge_id))
+
+        edge_index = [{}, {}]
+        for axis in range(2):
+            for c, intervals in lines[axis].items():
+                intervals.sort()
+                edge_index[axis][c] = ([start for start, _, _ in intervals],
+                                       [end for _, end, _ in intervals],
+                                       [edge_id for _, _, edge_id in intervals])
+        return edge_index
+
+    def _get_edge_with_pos(self, pos):
+        '''
+        Retrieve the edge (as a list of two nodes) whose interior contains pos, None if there is no such edge.
+        '''
+        found_edge_id = None
+        for axis in range(2):
+            line = self.edge_index[axis].get(pos[axis])
+            if line is None:
+                continue
+            starts, ends, edge_ids = line
+            k = bisect.bisect_left(starts, pos[1 - axis]) - 1
+            if k >= 0 and pos[1 - axis] < ends[k]:
+                # A position on two crossing edges belongs to the first one in the edges list
+                if found_edge_id is None or edge_ids[k] < found_edge_id:
+                    found_edge_id = edge_ids[k]
+        if found_edge_id is None:
+            return None
+        return list(self.edges[found_edge_id])
 
     def _get_node_to_neighbor_pos_distance(self, node, pos):
         node_pos = self.get_pos(node)               
@@ -1,4 +1,5 @@
 import json
+import numpy as np
 
 class CustomerCall(object):
     def __init__(self, start_pos, destination_pos, time):
@@ -13,9 +14,91 @@ class CustomerCall(object):
         return 'CustomerCall(time:{:.3f}, start_pos:({:.2f}, {:.2f}), dest_pos:({:.2f}, {:.2f}))'.format(self.time, self.start_pos[0], self.start_pos[1], 
                                                                                 self.destination_pos[0], self.destination_pos[1])
 
+class CustomerCallView(CustomerCall):
+    '''
+    A lazy view of one row of a CustomerCallBatch, the fields are read from the batch's columns on access.
+    '''
+    __slots__ = ['batch', 'index']
+
+    def __init__(self, batch, index):
+        self.batch = batch
+        self.index = index
+
+    @property
+    def time(self):
+        return float(self.batch.times[self.index])
+
+    @property
+    def start_pos(self):
+        return (float(self.batch.start_x[self.index]), float(self.batch.start_y[self.index]))
+
+    @property
+    def destination_pos(self):
+        return (float(self.batch.destination_x[self.index]), float(self.batch.destination_y[self.index]))
+
+    @property
+    def start_node_id(self):
+        return int(self.batch.start_node_ids[self.index])
+
+class CustomerCallBatch(object):
+    '''
+    Customer calls stored as contiguous columns: time, start x/y, destination x/y and start node id (-1 if unknown).
+    '''
+    def __init__(self, times, start_x, start_y, destination_x, destination_y, start_node_ids=None):
+        self.times = np.asarray(times, dtype=np.float64)
+        self.start_x = np.asarray(start_x, dtype=np.float64)
+        self.start_y = np.asarray(start_y, dtype=np.float64)
+        self.destination_x = np.asarray(destination_x, dtype=np.float64)
+        self.destination_y = np.asarray(destination_y, dtype=np.float64)
+        if start_node_ids is None:
+            start_node_ids = np.full(len(self.times), -1)
+        self.start_node_ids = np.asarray(start_node_ids, dtype=np.int32)
+
+    @staticmethod
+    def from_calls(customer_calls, city_graph=None):
+        '''
+        Pack a list of CustomerCall, the start node ids are resolved with city_graph if it is given.
+        '''
+        start_node_ids = None
+        if city_graph is not None:
+            start_node_ids = [city_graph.get_id(call.start_pos) for call in customer_calls]
+            start_node_ids = [-1 if idx is None else idx for idx in start_node_ids]
+        return CustomerCallBatch([call.time for call in customer_calls],
+                                 [call.start_pos[0] for call in customer_calls],
+                                 [call.start_pos[1] for call in customer_calls],
+                                 [call.destination_pos[0] for call in customer_calls],
+                                 [call.destination_pos[1] for call in customer_calls],
+                                 start_node_ids)
+
+    @staticmethod
+    def concatenate(batches):
+        return CustomerCallBatch(np.concatenate([batch.times for batch in batches]),
+                                 np.concatenate([batch.start_x for batch in batches]),
+                                 np.concatenate([batch.start_y for batch in batches]),
+                                 np.concatenate([batch.destination_x for batch in batches]),
+                                 np.concatenate([batch.destination_y for batch in batches]),
+                                 np.concatenate([batch.start_node_ids for batch in batches]))
+
+    def __len__(self):
+        return len(self.times)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice) or isinstance(index, np.ndarray):
+            return CustomerCallBatch(self.times[index], self.start_x[index], self.start_y[index],
+                                     self.destination_x[index], self.destination_y[index], self.start_node_ids[index])
+        if index < 0:
+            index += len(self)
+        return CustomerCallView(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield CustomerCallView(self, index)
+
+    def __repr__(self):
+        return 'CustomerCallBatch({} calls)'.format(len(self))
+
 class CustomerCallJSONEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, CustomerCall):
             return obj.__jsonencode__()
         return json.JSONEncoder.default(self, obj)
-
@@ -0,0 +1,124 @@
+import heapq
+import logging
+import numpy as np
+
+from util import profiling
+
+# Kinds of events, by priority of the events at the same time: the shifts and trips ending at a time are handled
+# before the training and the calls at that time, as in the hourly loop of main.py
+SHIFT_END = 0
+TRIP_END = 1
+TRAIN = 2
+SHIFT_START = 3
+DEMAND = 4
+CALL = 5
+EVENT_NAMES = ['ShiftEnd', 'TripEnd', 'Train', 'ShiftStart', 'Demand', 'Call']
+
+class EventScheduler(object):
+    '''
+    Priority queue of (time, kind, payload) events, popped by time then kind then insertion order.
+    '''
+    def __init__(self):
+        self.heap = []
+        self.count = 0
+
+    def __len__(self):
+        return len(self.heap)
+
+    def schedule(self, time, kind, payload=None):
+        heapq.heappush(self.heap, (time, kind, self.count, payload))
+        self.count += 1
+
+    def peek_time(self):
+        return self.heap[0][0] if len(self.heap) > 0 else None
+
+    def pop(self):
+        time, kind, _, payload = heapq.heappop(self.heap)
+        return time, kind, payload
+
+class EventClock(object):
+    '''
+    Discrete-event loop of a city and a coordinator: the clock jumps from event to event instead of stepping hours.
+    A Demand event at each hour generates the calls of the hour, each call is allocated at its own Call event.
+    Train events update the lookahead policy.
+    Shift starts / ends and trip completions are bookkeeping only: they move the drivers' schedule cursors, which the
+    next allocation would do anyway, so that the drivers' states and num_events follow the simulation time.
+    '''
+    def __init__(self, city, coordinator, timelimit, train_interval=None, on_calls=None):
+        '''
+        train_interval: hours between Train events, None for no training
+        on_calls: called with the CustomerCallBatch of each hour
+        '''
+        self.city = city
+        self.coordinator = coordinator
+        self.timelimit = timelimit
+        self.train_interval = train_interval
+        self.on_calls = on_calls
+        self.scheduler = EventScheduler()
+        self.num_events = [0] * len(EVENT_NAMES)
+        # Latest trip end scheduled for each driver
+        self.trip_ends = [None] * len(coordinator.drivers)
+
+        start_hour = city.time_sys.hour_in_sim()
+        if start_hour < timelimit:
+            self.scheduler.schedule(start_hour, DEMAND)
+        for driver in coordinator.drivers:
+            for start_time, end_time in zip(driver.state.shift_starts, driver.state.shift_ends):
+                if start_time >= start_hour and start_time <= timelimit:
+                    self.scheduler.schedule(start_time, SHIFT_START, driver)
+                if end_time >= start_hour and end_time <= timelimit:
+                    self.scheduler.schedule(end_time, SHIFT_END, driver)
+        if train_interval is not None:
+            hour = start_hour + train_interval
+            while hour <= timelimit:
+                self.scheduler.schedule(hour, TRAIN)
+                hour += train_interval
+
+    def run(self):
+        '''
+        Handle all the events until timelimit.
+        '''
+        time_sys = self.city.time_sys
+        while len(self.scheduler) > 0 and self.scheduler.peek_time() <= self.timelimit:
+            time, kind, payload = self.scheduler.pop()
+            time_sys.advance_to(time)
+            self.num_events[kind] += 1
+            if kind == CALL:
+                self._handle_call(payload)
+            elif kind == DEMAND:
+                self._handle_demand(time)
+            elif kind == TRAIN:
+                self.coordinator.train()
+                logging.info('Update the lookahead policy.')
+            else:
+                # ShiftStart, ShiftEnd and TripEnd
+                payload.state.advance(time)
+        # The hourly loop ends on a whole hour
+        if time_sys.hour_in_sim() < self.timelimit:
+            time_sys.advance_to(self.timelimit)
+
+    def _handle_demand(self, hour):
+        with profiling.timer('city.step'):
+            customer_calls = self.city.generate_calls()
+        if self.on_calls is not None:
+            self.on_calls(customer_calls)
+        # The batch is recorded once, its winners are filled in by the Call events
+        winners = np.full(len(customer_calls), -1, dtype=np.int64)
+        self.coordinator.record_calls(customer_calls, winners)
+        for k, time in enumerate(customer_calls.times.tolist()):
+            self.scheduler.schedule(time, CALL, (customer_calls, winners, k))
+        if hour + 1 < self.timelimit:
+            self.scheduler.schedule(hour + 1, DEMAND)
+
+    def _handle_call(self, payload):
+        customer_calls, winners, k = payload
+        with profiling.timer('coordinator.allocate'):
+            idx = self.coordinator.allocate_call(customer_calls[k])
+        winners[k] = idx
+        if idx >= 0:
+            # Schedule the completion of the trip of the winner, only its schedule has changed
+            driver = self.coordinator.drivers[idx]
+            next_free_time = driver.state.next_free_time
+            if next_free_time != self.trip_ends[idx]:
+                self.trip_ends[idx] = next_free_time
+                self.scheduler.schedule(next_free_time, TRIP_END, driver)
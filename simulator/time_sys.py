@@ -17,6 +17,14 @@ class TimeSystem(object):
         self.current_day = math.floor(self.current_sim_hour / TimeSystem.PERIOD)          
         self.current_hour = self.current_sim_hour % TimeSystem.PERIOD
 
+    def advance_to(self, hour_in_sim):
+        '''
+        Jump forward to hour_in_sim, which needs not be a whole hour.
+        '''
+        if hour_in_sim < self.current_sim_hour:
+            raise Exception('Error: cannot go back in time. ({} < {})'.format(hour_in_sim, self.current_sim_hour))
+        self.step(hour_in_sim - self.current_sim_hour)
+
     def day(self):
         return math.floor(self.hour_in_sim() / TimeSystem.PERIOD)          
 
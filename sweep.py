@@ -0,0 +1,133 @@
+import logging
+import os
+import argparse
+import itertools
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from tabulate import tabulate
+
+from simulator.city_graph import CityGraph
+from simulator.call_trace import CallTrace
+
+from main import FORMAT, simulate, get_driver_stats, get_company_stats
+
+from config import Config
+
+# Columns of the results file, one row per run and one 'driver_' row per driver of a run
+RUN_COLUMNS = ['auction_type', 'payment_rule', 'bidding_strategy', 'payment_ratio', 'waiting_time_threshold', 'seed']
+COMPANY_COLUMNS = ['acc_payoff', 'avg_payoff', 'avg_waiting_time']
+DRIVER_COLUMNS = ['driver_run', 'driver_shift', 'driver_id', 'driver_acc_payoff', 'driver_avg_payoff', 'driver_avg_waiting_time', 'driver_return_cost']
+
+# State of a worker process, set by _init_worker
+_worker = {}
+
+def share_arrays(arrays):
+    '''
+    Copy the arrays into shared memory blocks.
+    Return the blocks (close and unlink them when done) and the specs to attach them with attach_arrays.
+    '''
+    blocks = []
+    specs = {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        blocks.append(block)
+        specs[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, specs
+
+def attach_arrays(specs):
+    '''
+    Attach the shared arrays of share_arrays as read-only ndarrays, return the blocks (keep them alive) and the arrays.
+    '''
+    blocks = []
+    arrays = {}
+    for name, (block_name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        array.flags.writeable = False
+        blocks.append(block)
+        arrays[name] = array
+    return blocks, arrays
+
+def _init_worker(intersections, specs, level, replay_trace):
+    logging.basicConfig(format=FORMAT, level=level, datefmt='%d-%m-%Y:%H:%M:%S')
+    blocks, arrays = attach_arrays(specs)
+    _worker['blocks'] = blocks
+    _worker['city_graph'] = CityGraph(intersections, arrays=arrays)
+    _worker['trace'] = CallTrace(replay_trace) if replay_trace is not None else None
+
+def _run(run, auction_type, payment_rule, bidding_strategy, payment_ratio, waiting_time_threshold, seed, timelimit):
+    config = Config(waiting_time_threshold=waiting_time_threshold, payment_ratio=payment_ratio)
+    coordinator = simulate(config, auction_type, payment_rule, bidding_strategy, timelimit, city_graph=_worker['city_graph'], seed=seed,
+                            replay_trace=_worker['trace'])
+    return run, get_driver_stats(coordinator, config, timelimit), get_company_stats(coordinator)
+
+def run_sweep(grid, timelimit, num_workers, graph_cache_dir=None, level=logging.ERROR, replay_trace=None):
+    '''
+    Run each configuration of the grid (tuples in RUN_COLUMNS order) in a pool of num_workers processes.
+    With replay_trace (path of a recorded trace), all the runs see the same customers' calls.
+    Return the columns of the results by name.
+    '''
+    config = Config()
+    city_graph = CityGraph(config.intersections, cache_dir=graph_cache_dir)
+    blocks, specs = share_arrays(city_graph.get_arrays())
+    stats_drivers = [None] * len(grid)
+    stats_company = [None] * len(grid)
+    try:
+        with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker, initargs=(config.intersections, specs, level, replay_trace)) as executor:
+            futures = [executor.submit(_run, run, *params, timelimit=timelimit) for run, params in enumerate(grid)]
+            for future in as_completed(futures):
+                run, stats_drivers[run], stats_company[run] = future.result()
+                logging.info('Done {}'.format(grid[run]))
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    columns = {}
+    for k, name in enumerate(RUN_COLUMNS):
+        columns[name] = np.asarray([params[k] for params in grid])
+    for k, name in enumerate(COMPANY_COLUMNS):
+        columns[name] = np.asarray([stats[k] for stats in stats_company], dtype=np.float64)
+    rows = [[run] + stats for run, stats_run in enumerate(stats_drivers) for stats in stats_run]
+    for k, name in enumerate(DRIVER_COLUMNS):
+        columns[name] = np.asarray([row[k] for row in rows])
+    return columns
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--auction-types', help='Auction types of taxi coordinator', type=str, nargs='+', choices=['first-price', 'second-price'], default=['first-price', 'second-price'])
+    parser.add_argument('--payment-rules', help='Payment computation rules', type=str, nargs='+', choices=['type-1', 'type-2', 'type-3'], default=['type-1', 'type-2', 'type-3'])
+    parser.add_argument('--bidding-strategies', help='Bidding strategies of taxi drivers', type=str, nargs='+', choices=['truthful', 'shade', 'lookahead'], default=['truthful'])
+    parser.add_argument('--payment-ratios', help='Payment ratios', type=float, nargs='+', default=[0.3])
+    parser.add_argument('--waiting-time-thresholds', help='Waiting time thresholds (hour_simulation)', type=float, nargs='+', default=[24.0])
+    parser.add_argument('--seeds', help='Random seeds, one run per seed (same results as main.py --seed)', type=int, nargs='+', default=[0])
+    parser.add_argument('--timelimit', help='Simulation timelimit (hour_simulation)', type=int, default=24)
+    parser.add_argument('--workers', help='Number of worker processes', type=int, default=os.cpu_count())
+    parser.add_argument('--output', help='Results file (.npz of columns)', type=str, default=os.path.join('data', 'sweep-results.npz'))
+    parser.add_argument('--verbose', help='Show log', type=str, choices=['info', 'debug'], default=None)
+    parser.add_argument('--replay-trace', help='Replay the customers\' calls of a recorded trace directory in all runs', type=str, default=None)
+    parser.add_argument('--no-graph-cache', help='Do not read/write the city graph cache', action='store_true', default=False)
+    args = parser.parse_args()
+
+    level = logging.ERROR
+    if args.verbose == 'info':
+        level = logging.INFO
+    elif args.verbose == 'debug':
+        level = logging.DEBUG
+
+    logging.basicConfig(format=FORMAT, level=level, datefmt='%d-%m-%Y:%H:%M:%S')
+
+    grid = list(itertools.product(args.auction_types, args.payment_rules, args.bidding_strategies,
+                                    args.payment_ratios, args.waiting_time_thresholds, args.seeds))
+    graph_cache_dir = None if args.no_graph_cache else Config().graph_cache_dir
+    columns = run_sweep(grid, args.timelimit, args.workers, graph_cache_dir=graph_cache_dir, level=level, replay_trace=args.replay_trace)
+    np.savez(args.output, **columns)
+
+    print('===Company===')
+    print(tabulate([[columns[name][run] for name in RUN_COLUMNS + COMPANY_COLUMNS] for run in range(len(grid))],
+            headers=['Auction', 'Payment rule', 'Bidding', 'Payment ratio', 'Waiting time threshold', 'Seed',
+                     'Acc. payoff', 'Avg. payoff', 'Avg. waiting time (hours)']))
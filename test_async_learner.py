@@ -0,0 +1,95 @@
+import threading
+import numpy as np
+import torch
+
+from auction.rl import REINFORCEAgent
+from auction.async_learner import AsyncLearner
+
+def make_batch(rng, n=20):
+    agent = REINFORCEAgent(7, 1, seed=1)
+    states = rng.random((n, 7))
+    actions, _ = agent.act_batch(states)
+    return states, actions, rng.normal(size=n), np.zeros(n, dtype=bool)
+
+def test_publish():
+    rng = np.random.default_rng(0)
+    agent = REINFORCEAgent(7, 1, seed=0)
+    initial = [p.detach().clone() for p in agent.policy.parameters()]
+    learner = AsyncLearner(agent)
+    for _ in range(3):
+        assert learner.submit(*make_batch(rng))
+    learner.close()
+    assert learner.num_updates == 3 and learner.num_dropped == 0
+    for actor, trained, init in zip(agent.policy.parameters(), learner.learner_agent.policy.parameters(), initial):
+        assert torch.equal(actor, trained)
+        assert not torch.equal(actor, init)
+
+def test_drop_when_full():
+    rng = np.random.default_rng(0)
+    learner = AsyncLearner(REINFORCEAgent(7, 1, seed=0), max_queue_size=1)
+    # Hold the learner in its first update
+    release = threading.Event()
+    started = threading.Event()
+    train = learner.learner_agent.train
+    def slow_train(*batch):
+        started.set()
+        release.wait()
+        train(*batch)
+    learner.learner_agent.train = slow_train
+    assert learner.submit(*make_batch(rng))
+    started.wait()
+    assert learner.submit(*make_batch(rng))
+    assert not learner.submit(*make_batch(rng))
+    release.set()
+    learner.close()
+    assert learner.num_updates == 2 and learner.num_dropped == 1
+
+def test_train_error():
+    rng = np.random.default_rng(0)
+    learner = AsyncLearner(REINFORCEAgent(7, 1, seed=0), max_queue_size=2)
+    def failing_train(*batch):
+        raise ValueError('training failed')
+    learner.learner_agent.train = failing_train
+    assert learner.submit(*make_batch(rng))
+    learner.thread.join(timeout=10)
+    assert not learner.thread.is_alive()
+    for call in [lambda: learner.submit(*make_batch(rng)), learner.pull, learner.close, learner.close]:
+        try:
+            call()
+            assert False
+        except ValueError as e:
+            assert str(e) == 'training failed'
+    assert learner.thread is None
+
+def test_close_full_queue_after_error():
+    rng = np.random.default_rng(0)
+    learner = AsyncLearner(REINFORCEAgent(7, 1, seed=0), max_queue_size=2)
+    # The learner fails on the first batch while the next ones fill the queue
+    release = threading.Event()
+    def failing_train(*batch):
+        release.wait()
+        raise ValueError('training failed')
+    learner.learner_agent.train = failing_train
+    for _ in range(3):
+        assert learner.submit(*make_batch(rng))
+    release.set()
+    learner.thread.join(timeout=10)
+    try:
+        learner.close()
+        assert False
+    except ValueError:
+        pass
+
+def test_async_simulation():
+    from main import simulate
+    from config import Config
+    coordinator = simulate(Config(), 'second-price', 'type-1', 'lookahead', 17, seed=0, async_training=True)
+    assert coordinator.learner.thread is None
+    assert coordinator.learner.num_updates + coordinator.learner.num_dropped > 0
+
+if __name__ == '__main__':
+    test_publish()
+    test_drop_when_full()
+    test_train_error()
+    test_close_full_queue_after_error()
+    test_async_simulation()
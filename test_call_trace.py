@@ -0,0 +1,34 @@
+import os
+import tempfile
+
+from simulator.city import City
+from simulator.call_trace import CallTraceRecorder, CallTrace, ReplayCity
+
+from config import Config
+
+def test_record_and_replay():
+    config = Config()
+    city = City(config.intersections, initial_hour=0, lambd_schedule=config.city_lambd_schedule, rng=0)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'trace')
+        recorder = CallTraceRecorder(path)
+        recorded = []
+        for _ in range(3):
+            customer_calls = city.step()
+            recorder.record(customer_calls)
+            recorded.append(customer_calls)
+        recorder.close()
+
+        trace = CallTrace(path)
+        assert len(trace) == sum(len(customer_calls) for customer_calls in recorded)
+        replay_city = ReplayCity(trace, config.intersections, initial_hour=0, city_graph=city.city_graph)
+        for customer_calls in recorded:
+            replayed = replay_city.step()
+            assert (replayed.times == customer_calls.times).all()
+            assert (replayed.destination_x == customer_calls.destination_x).all()
+            assert (replayed.start_node_ids == customer_calls.start_node_ids).all()
+        # Past the end of the trace
+        assert len(replay_city.step()) == 0
+
+if __name__ == '__main__':
+    test_record_and_replay()
@@ -0,0 +1,35 @@
+from simulator.city import City
+from simulator.customer_call import CustomerCall, CustomerCallBatch
+from auction.taxi_coordinator import TaxiCoordinator
+
+from config import Config
+
+def test_customer_call_batch():
+    calls = [CustomerCall((4, 4), (5, 4), 1), CustomerCall((5, 6), (5, 8), 2), CustomerCall((4, 7), (4, 12.5), 11)]
+    batch = CustomerCallBatch.from_calls(calls)
+    assert len(batch) == 3
+    assert batch[1].time == 2 and batch[1].start_pos == (5, 6) and batch[1].destination_pos == (5, 8)
+    assert batch[-1].destination_pos == (4, 12.5)
+    assert [call.time for call in batch[1:]] == [2, 11]
+    assert len(CustomerCallBatch.concatenate([batch, batch[:1]])) == 4
+    assert list(batch.start_node_ids) == [-1, -1, -1]
+
+def test_allocate_batch():
+    config = Config()
+    def _allocate(customer_calls):
+        city = City(config.intersections, 0, config.city_lambd_schedule)
+        coordinator = TaxiCoordinator(city=city, auction_type='second-price', payment_rule='type-1', bidding_strategy='truthful',
+                                      drivers_schedule=[[(5, 10)], []], init_pos=config.init_pos)
+        winners = coordinator.allocate(customer_calls)
+        return coordinator, winners
+    calls = [CustomerCall((4, 4), (5, 4), 1), CustomerCall((5, 6), (5, 8), 2), CustomerCall((4, 7), (4, 12.5), 11)]
+    coordinator_list, _ = _allocate(calls)
+    coordinator_batch, winners = _allocate(CustomerCallBatch.from_calls(calls))
+    assert coordinator_list.get_history_calls() == coordinator_batch.get_history_calls()
+    assert coordinator_list.get_payoff() == coordinator_batch.get_payoff()
+    assert [call['accept'] for call in coordinator_batch.get_history_calls()] == [True, True, True]
+    assert [len(driver.get_history_payoff()) for driver in coordinator_batch.drivers] == [winners.tolist().count(idx) for idx in range(2)]
+
+if __name__ == '__main__':
+    test_customer_call_batch()
+    test_allocate_batch()
@@ -0,0 +1,53 @@
+from simulator.event_clock import EventScheduler, EventClock, CALL, DEMAND, TRIP_END, SHIFT_START, SHIFT_END, TRAIN
+from simulator.time_sys import TimeSystem
+
+from main import simulate, get_company_stats
+from config import Config
+
+def test_event_scheduler():
+    scheduler = EventScheduler()
+    scheduler.schedule(2.5, CALL, 'c1')
+    scheduler.schedule(1.0, DEMAND)
+    scheduler.schedule(2.5, TRIP_END, 'd0')
+    scheduler.schedule(2.5, CALL, 'c2')
+    assert scheduler.peek_time() == 1.0
+    assert [scheduler.pop() for _ in range(4)] == [(1.0, DEMAND, None), (2.5, TRIP_END, 'd0'), (2.5, CALL, 'c1'), (2.5, CALL, 'c2')]
+    assert len(scheduler) == 0
+
+def test_advance_to():
+    time_sys = TimeSystem(0)
+    time_sys.advance_to(25.5)
+    assert time_sys.day() == 1 and time_sys.hour_in_a_day() == 1.5
+    try:
+        time_sys.advance_to(3)
+        assert False
+    except Exception:
+        pass
+
+def test_event_clock():
+    config = Config()
+    coordinator_hour = simulate(config, 'second-price', 'type-1', 'shade', 30, seed=3)
+    coordinator_event = simulate(config, 'second-price', 'type-1', 'shade', 30, seed=3, clock='event')
+    assert get_company_stats(coordinator_event) == get_company_stats(coordinator_hour)
+    assert coordinator_event.city.time_sys.hour_in_sim() == 30
+    assert coordinator_event.get_history_calls() == coordinator_hour.get_history_calls()
+
+def test_event_clock_events():
+    config = Config()
+    coordinator = simulate(config, 'first-price', 'type-1', 'truthful', 0, seed=0)
+    clock = EventClock(coordinator.city, coordinator, 24, train_interval=8)
+    clock.run()
+    assert clock.num_events[DEMAND] == 24 and clock.num_events[TRAIN] == 3
+    # Shifts starting and ending within the first day
+    assert clock.num_events[SHIFT_START] == 12 and clock.num_events[SHIFT_END] == 8
+    # One recorded batch per hour, not per call
+    assert len(coordinator.history_call_batches) == 24
+    assert clock.num_events[CALL] == sum(len(customer_calls) for customer_calls, _ in coordinator.history_call_batches)
+    # Trips ending after the timelimit are not handled
+    assert 0 < len(coordinator.get_history_payoff()) - clock.num_events[TRIP_END] <= len(coordinator.drivers)
+
+if __name__ == '__main__':
+    test_event_scheduler()
+    test_advance_to()
+    test_event_clock()
+    test_event_clock_events()
@@ -0,0 +1,49 @@
+import os
+import tempfile
+
+from simulator.customer_call import CustomerCall
+from util.event_log import EventLog, read_event_log
+
+from main import simulate, get_driver_stats, get_company_stats
+from config import Config
+
+class _Plan(object):
+    def __init__(self, start_time, end_time, waiting_time_period):
+        self.start_time = start_time
+        self.end_time = end_time
+        self.waiting_time_period = waiting_time_period
+
+def test_event_log_chunks():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        event_log = EventLog(os.path.join(tmp_dir, 'events.bin'), chunk_size=4)
+        for k in range(10):
+            call = CustomerCall((0, k), (1, k), k * 0.1)
+            if k % 3 == 0:
+                event_log.append_reject(call)
+            else:
+                event_log.append_accept(call, k % 2, _Plan(10 - k if k % 2 == 0 else k, 11, 0.5 * k), payment=k, payoff=2.0 * k)
+        # Two full chunks are on disk, the rest is buffered
+        assert len(read_event_log(event_log.path)) == 8
+        event_log.close()
+        records = read_event_log(event_log.path)
+        assert len(records) == 10
+        assert list(event_log.get_history_payoff()) == [1, 2, 4, 5, 7, 8]
+        assert list(event_log.get_driver_history_payoff(1)) == [2, 10, 14]
+        # By start time, as the driver's plans
+        assert list(event_log.get_driver_waiting_time_periods(0)) == [4.0, 2.0, 1.0]
+        assert [call['accept'] for call in event_log.get_history_calls()] == [k % 3 != 0 for k in range(10)]
+
+def test_event_log_stats():
+    config = Config()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        coordinator = simulate(config, 'first-price', 'type-1', 'shade', 6, seed=0)
+        coordinator_logged = simulate(config, 'first-price', 'type-1', 'shade', 6, seed=0, event_log=os.path.join(tmp_dir, 'events.bin'))
+        assert coordinator_logged.history_payoff == [] and coordinator_logged.history_call_batches == []
+        assert all(len(driver.plans) <= 1 for driver in coordinator_logged.drivers)
+        assert get_company_stats(coordinator_logged) == get_company_stats(coordinator)
+        assert get_driver_stats(coordinator_logged, config, 6) == get_driver_stats(coordinator, config, 6)
+        assert coordinator_logged.get_history_calls() == coordinator.get_history_calls()
+
+if __name__ == '__main__':
+    test_event_log_chunks()
+    test_event_log_stats()
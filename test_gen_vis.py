@@ -0,0 +1,33 @@
+from gen_vis import compute_timings, Playback, CallStream, STATE_FREE, STATE_SHIFT, STATE_DRIVING
+
+def test_compute_timings():
+    # Timings accumulate along a route which goes back on itself
+    assert compute_timings(1.0, [(4, 8), (4, 10), (4, 9)], 2.0) == [1.0, 2.0, 2.5]
+
+def test_playback():
+    schedules = [[{'start_time': 0, 'end_time': 1, 'event_name': 'Free', 'route': None},
+                  {'start_time': 1, 'end_time': 2.5, 'event_name': 'Call', 'route': [[4, 8], [4, 10], [4, 9]]},
+                  {'start_time': 2.5, 'end_time': 3, 'event_name': 'Free', 'route': None},
+                  {'start_time': 3, 'end_time': 5, 'event_name': 'Shift', 'route': None}],
+                 [],
+                 [{'start_time': 0, 'end_time': 2, 'event_name': 'Shift', 'route': None}]]
+    playback = Playback(schedules, 2.0)
+    poses, states = playback.update(1.5)
+    assert poses.tolist() == [[4, 9], [4, 8], [4, 8]]
+    assert states.tolist() == [STATE_DRIVING, STATE_FREE, STATE_SHIFT]
+    poses, states = playback.update(2.75)
+    assert poses[0].tolist() == [4, 9] and states[0] == STATE_FREE
+    # Cars stay at the end of their last segment
+    poses, states = playback.update(10)
+    assert poses[0].tolist() == [4, 8] and states[0] == STATE_SHIFT
+
+def test_call_stream():
+    calls = CallStream([{'time': t, 'start_pos': (0, t), 'accept': t > 2} for t in [0.5, 1.0, 1.5, 3.0]])
+    visible = calls.get_range(1.2, 0.5)
+    assert calls.times[visible].tolist() == [1.0, 1.5]
+    assert len(calls.times[calls.get_range(2.2, 0.5)]) == 0
+
+if __name__ == '__main__':
+    test_compute_timings()
+    test_playback()
+    test_call_stream()
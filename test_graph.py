@@ -0,0 +1,88 @@
+import tempfile
+import numpy as np
+
+from util.graph import Graph
+from simulator.city_graph import CityGraph
+
+def test_shortest_path_methods():
+    graph = np.array([[0,10,20,30,0,0],[0,0,0,0,0,7],[0,0,0,0,0,5],[0,0,0,0,10,0],[2,0,0,0,0,4],[0,5,7,0,6,0]])
+    g_fw = Graph(graph.copy(), method='floyd-warshall')
+    g_dijkstra = Graph(graph.copy(), method='dijkstra')
+    assert (g_fw.distance_matrix == g_dijkstra.distance_matrix).all()
+    assert g_fw.get_path(0, 5) == [0, 1, 5]
+    assert g_fw.get_path(1, 3) == [1, 5, 4, 0, 3]
+
+def test_city_graph_methods():
+    intersections = [(i, j) for i in range(0, 12, 2) for j in range(0, 15, 3)]
+    g_fw = CityGraph(intersections, method='floyd-warshall')
+    g_dijkstra = CityGraph(intersections, method='dijkstra')
+    assert (g_fw.distance_matrix == g_dijkstra.distance_matrix).all()
+    assert g_fw.get_shortest_distance(g_fw.get_id((0, 0)), g_fw.get_id((10, 12))) == 22
+
+def test_city_graph_cache():
+    intersections = [(i, j) for i in range(0, 12, 2) for j in range(0, 15, 3)]
+    g = CityGraph(intersections)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        g_built = CityGraph(intersections, cache_dir=cache_dir)
+        g_cached = CityGraph(intersections, cache_dir=cache_dir)
+        assert (g_cached.distance_matrix == g.distance_matrix).all()
+        assert (g_cached.predessor_matrix == g.predessor_matrix).all()
+        assert (g_cached.next_hops == g.next_hops).all()
+        assert (g_cached.adj_matrix == g_built.adj_matrix).all()
+        assert g_cached.edges == g.edges
+        assert g_cached.get_shortest_path(0, len(intersections) - 1) == g.get_shortest_path(0, len(intersections) - 1)
+        assert CityGraph.get_cache_key(intersections) != CityGraph.get_cache_key(intersections[::-1])
+
+def test_city_graph_shortest_path():
+    intersections = [(i, j) for i in range(0, 12, 2) for j in range(0, 15, 3)]
+    g = CityGraph(intersections)
+    for u in range(len(intersections)):
+        for v in range(len(intersections)):
+            path = g.get_shortest_path(u, v)
+            assert path == g.get_path(u, v)
+            assert g.get_shortest_path(u, v, convert_to_pos=True) == [intersections[node] for node in path]
+    distance, path = g.get_pos_shortest_distance((0, 1), (10, 10.5))
+    assert distance == 19.5
+    assert path[0] == (0, 1) and path[-1] == (10, 10.5)
+
+def test_edge_index():
+    intersections = [(i, j) for i in range(0, 12, 2) for j in range(0, 15, 3)]
+    g = CityGraph(intersections)
+    assert g._get_edge_with_pos((0, 1)) == [g.get_id((0, 0)), g.get_id((0, 3))]
+    assert g._get_edge_with_pos((3, 6)) == [g.get_id((2, 6)), g.get_id((4, 6))]
+    assert g._get_edge_with_pos((0, 3)) is None
+    assert g._get_edge_with_pos((1, 1)) is None
+    assert g._get_edge_with_pos((0, 13)) is None
+
+def test_sample_pos_on_distance():
+    intersections = [(i, j) for i in range(0, 12, 2) for j in range(0, 15, 3)]
+    g = CityGraph(intersections)
+    start_node_idx = g.get_id((4, 6))
+    for distance in [0.5, 1.25, 2.0, 3.7, 8.1]:
+        poses = g.get_poses_on_distance(start_node_idx, distance)
+        for u in np.linspace(0, 1, 16, endpoint=False):
+            pos = g.sample_pos_on_distance(start_node_idx, distance, u)
+            assert min(abs(pos[0] - p[0]) + abs(pos[1] - p[1]) for p in poses) < 1e-9
+    assert sorted(g.get_poses_on_distance(start_node_idx, 1)) == [(3, 6), (4, 5), (4, 7), (5, 6)]
+    assert g.sample_pos_on_distance(start_node_idx, 100, 0.5) is None
+    # The farthest positions are at the last break
+    farthest = g.get_destination_table(start_node_idx).breaks[-1]
+    poses = g.get_poses_on_distance(start_node_idx, farthest)
+    assert len(poses) > 0
+    assert all(g.sample_pos_on_distance(start_node_idx, farthest, u) in poses for u in np.linspace(0, 1, 8, endpoint=False))
+
+def test_long_path():
+    # A single street of 1500 intersections, deeper than the recursion limit
+    intersections = [(0, j) for j in range(1500)] + [(1, 0), (1, 1499)]
+    g = CityGraph(intersections, method='dijkstra')
+    assert len(g.get_shortest_path(0, 1499)) == 1500
+    assert len(g.get_path(0, 1499)) == 1500
+
+if __name__ == '__main__':
+    test_shortest_path_methods()
+    test_city_graph_methods()
+    test_city_graph_cache()
+    test_city_graph_shortest_path()
+    test_edge_index()
+    test_sample_pos_on_distance()
+    test_long_path()
@@ -1,6 +1,24 @@
+import numpy as np
+
 from util.distribution import PoissonProcess
 
+def test_sample_arrivals():
+    p = PoissonProcess(3)
+    process_ids, arrival_times = p.sample_arrivals(1000, duration=2.0)
+    assert len(process_ids) == len(arrival_times)
+    assert np.all(np.diff(arrival_times) >= 0)
+    assert np.all((arrival_times >= 0) & (arrival_times < 2.0))
+    # 1000 processes with 6 arrivals on average
+    assert abs(len(arrival_times) / 1000.0 - 6.0) < 0.5
+
+def test_seeded_arrivals():
+    process_ids_a, arrival_times_a = PoissonProcess(3, rng=5).sample_arrivals(100)
+    process_ids_b, arrival_times_b = PoissonProcess(3, rng=np.random.default_rng(5)).sample_arrivals(100)
+    assert (process_ids_a == process_ids_b).all() and (arrival_times_a == arrival_times_b).all()
+
 if __name__ == '__main__':
     p = PoissonProcess(3)
     for i in range(10):
         print(p())
+    test_sample_arrivals()
+    test_seeded_arrivals()
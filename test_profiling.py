@@ -0,0 +1,36 @@
+from util import profiling
+
+from main import simulate
+from config import Config
+
+def test_profiler():
+    profiling.disable()
+    with profiling.timer('stage'):
+        profiling.count('items', 3)
+    assert profiling.get_profiler() is None
+
+    profiler = profiling.enable()
+    for _ in range(2):
+        with profiling.timer('stage'):
+            profiling.count('items', 3)
+    profiler.stop()
+    assert profiler.calls['stage'] == 2 and profiler.counters['items'] == 6
+    assert profiler.get_stage_stats()[0][:2] == ['stage', 2]
+    assert profiler.get_throughput('items', 'stage') > 0
+    assert profiler.get_throughput('items', 'other') is None
+    profiling.disable()
+
+def test_simulation_stages():
+    profiler = profiling.enable()
+    try:
+        simulate(Config(), 'first-price', 'type-1', 'truthful', 3, seed=0)
+    finally:
+        profiling.disable()
+    for stage in ['city.step', 'city.generate_calls', 'coordinator.allocate', 'coordinator.unrestricted_drivers']:
+        assert profiler.calls[stage] > 0
+    assert profiler.calls['coordinator.allocate'] == 3
+    assert profiler.counters['calls'] == profiler.calls['coordinator.unrestricted_drivers']
+
+if __name__ == '__main__':
+    test_profiler()
+    test_simulation_stages()
@@ -0,0 +1,27 @@
+import numpy as np
+
+from auction.replay_buffer import ExperienceBuffer
+
+def test_ring():
+    buffer = ExperienceBuffer(4, 7, 1)
+    for t in range(3):
+        buffer.append(np.full(7, t), [t], float(t), t == 2)
+    states, actions, rewards, dones = buffer.get()
+    # Views of the preallocated arrays before wrapping around
+    assert np.shares_memory(states, buffer.states)
+    assert states[:, 0].tolist() == [0, 1, 2] and actions[:, 0].tolist() == [0, 1, 2]
+    assert rewards.tolist() == [0, 1, 2] and dones.tolist() == [False, False, True]
+
+    # The oldest experience is overwritten
+    for t in range(3, 6):
+        buffer.append(np.full(7, t), [t], float(t), False)
+    states, actions, rewards, dones = buffer.get()
+    assert len(buffer) == 4
+    assert states[:, 6].tolist() == [2, 3, 4, 5] and rewards.tolist() == [2, 3, 4, 5]
+    assert dones.tolist() == [True, False, False, False]
+
+    buffer.clear()
+    assert len(buffer) == 0 and len(buffer.get()[0]) == 0
+
+if __name__ == '__main__':
+    test_ring()
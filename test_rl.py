@@ -1,7 +1,9 @@
+import os
+import tempfile
 import numpy as np
 import torch
 
-from auction.rl import REINFORCEAgent
+from auction.rl import REINFORCEAgent, discount_rewards
 
 class MockEnv(object):
     def reset(self):
@@ -18,19 +20,97 @@ env = MockEnv()
 
 states = []
 actions = []
-action_log_probs = []
 rewards = []
 dones = []
 
 for t in range(10):
     s = env.observe()
-    action, action_log_prob = agent.act(s)
+    action, _ = agent.act(s)
     r, d = env.try_bid(action)
     states.append(s)
     actions.append(action)
-    action_log_probs.append(action_log_prob)
     rewards.append(r)
     dones.append(d)
 
-agent.train(states=states, actions=actions, log_probs=action_log_probs, rewards=rewards, dones=dones)
+agent.train(states=states, actions=actions, rewards=rewards, dones=dones)
     
+
+def test_act_batch():
+    states = np.random.default_rng(0).random((5, 7))
+    agent = REINFORCEAgent(7, 1, seed=0)
+    actions, action_log_probs = agent.act_batch(states)
+    assert actions.shape == (5, 1) and action_log_probs.shape == (5, 1)
+    # The recorded log-probabilities are the ones recomputed with gradient at training
+    log_probs = agent.log_prob(states, actions)
+    assert log_probs.requires_grad
+    assert np.allclose(log_probs.detach().numpy(), action_log_probs, atol=1e-5)
+    assert np.array_equal(REINFORCEAgent(7, 1, seed=0).act_batch(states)[0], actions)
+
+def test_lookahead_training():
+    from main import simulate
+    from config import Config
+    # Trains at hour 8 on the bids sampled by the batches
+    coordinator = simulate(Config(), 'second-price', 'type-1', 'lookahead', 9, seed=0)
+    assert all(len(driver.history) == 0 or driver.get_history()[0][0, 6] >= 8 for driver in coordinator.drivers)
+
+def test_discount_rewards():
+    rng = np.random.default_rng(0)
+    for gamma in [0.99, 0.5, 0.05, 0.01, 0.0, 1.0]:
+        for n in [1, 255, 256, 600]:
+            rewards = rng.normal(size=n)
+            dones = rng.random(n) < 0.02
+            expected = np.zeros(n)
+            R = 0.0
+            for t in range(n - 1, -1, -1):
+                R = rewards[t] + (0.0 if dones[t] else gamma * R)
+                expected[t] = R
+            assert np.allclose(discount_rewards(rewards, dones, gamma, chunk_size=256), expected)
+
+def test_joint_training():
+    from main import simulate
+    from config import Config
+    coordinator = simulate(Config(), 'second-price', 'type-1', 'lookahead', 9, seed=0, joint_training=True)
+    assert all(np.isfinite(p.detach().numpy()).all() for p in coordinator.drivers[0].lookahead_policy.policy.parameters())
+
+def test_save_load():
+    rng = np.random.default_rng(0)
+    states, rewards = rng.random((20, 7)), rng.normal(size=20)
+    agent = REINFORCEAgent(7, 1, seed=0)
+    actions, _ = agent.act_batch(states)
+    agent.train(states, actions, rewards, np.zeros(20, dtype=bool))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'policy.pt')
+        agent.save(path)
+        loaded = REINFORCEAgent(7, 1, seed=1)
+        loaded.load(path)
+        try:
+            REINFORCEAgent(5, 1).load(path)
+            assert False
+        except Exception as e:
+            assert 'error' in str(e)
+    # Same weights and the same optimizer state, so the same next update
+    for agent_ in [agent, loaded]:
+        agent_.train(states, actions, rewards, np.zeros(20, dtype=bool))
+    for p, q in zip(agent.policy.parameters(), loaded.policy.parameters()):
+        assert torch.equal(p, q)
+
+def test_inference_only():
+    from main import simulate
+    from config import Config
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'policy.pt')
+        REINFORCEAgent(7, 1, seed=0).save(path)
+        coordinator = simulate(Config(), 'second-price', 'type-1', 'lookahead', 9, seed=0, policy_checkpoint=path, inference_only=True)
+        loaded = REINFORCEAgent(7, 1)
+        loaded.load(path)
+    assert all(driver.history is None for driver in coordinator.drivers)
+    for p, q in zip(coordinator.lookahead_policy.policy.parameters(), loaded.policy.parameters()):
+        assert torch.equal(p, q)
+
+if __name__ == '__main__':
+    test_act_batch()
+    test_lookahead_training()
+    test_discount_rewards()
+    test_joint_training()
+    test_save_load()
+    test_inference_only()
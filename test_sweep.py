@@ -0,0 +1,43 @@
+import numpy as np
+
+from simulator.city_graph import CityGraph
+from main import simulate, get_company_stats
+from config import Config
+from sweep import share_arrays, attach_arrays, run_sweep, RUN_COLUMNS, COMPANY_COLUMNS, DRIVER_COLUMNS
+
+def test_shared_city_graph():
+    intersections = [(i, j) for i in range(0, 12, 2) for j in range(0, 15, 3)]
+    g = CityGraph(intersections)
+    blocks, specs = share_arrays(g.get_arrays())
+    try:
+        attached_blocks, arrays = attach_arrays(specs)
+        g_shared = CityGraph(intersections, arrays=arrays)
+        assert (g_shared.distance_matrix == g.distance_matrix).all()
+        assert g_shared.edges == g.edges
+        assert g_shared.get_shortest_path(0, len(intersections) - 1) == g.get_shortest_path(0, len(intersections) - 1)
+        del g_shared, arrays
+        for block in attached_blocks:
+            block.close()
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+def test_run_sweep():
+    grid = [('first-price', 'type-1', 'truthful', 0.3, 24.0, 0), ('second-price', 'type-2', 'shade', 0.3, 24.0, 1)]
+    columns = run_sweep(grid, timelimit=2, num_workers=2)
+    for name in RUN_COLUMNS + COMPANY_COLUMNS:
+        assert len(columns[name]) == len(grid)
+    assert list(columns['auction_type']) == ['first-price', 'second-price']
+    for name in DRIVER_COLUMNS:
+        assert len(columns[name]) == len(columns['driver_run'])
+    assert set(np.unique(columns['driver_run'])) <= {0, 1}
+
+    # A run of the pool is the same as the serial run with its seed
+    config = Config(waiting_time_threshold=24.0, payment_ratio=0.3)
+    stats_company = get_company_stats(simulate(config, 'second-price', 'type-2', 'shade', 2, seed=1))
+    assert [columns[name][1] for name in COMPANY_COLUMNS] == stats_company
+
+if __name__ == '__main__':
+    test_shared_city_graph()
+    test_run_sweep()
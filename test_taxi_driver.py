@@ -0,0 +1,73 @@
+import numpy as np
+
+from simulator.city_graph import CityGraph
+from simulator.customer_call import CustomerCall
+from auction.taxi_driver import TaxiDriver, PlanBatch
+
+from config import Config
+
+def _make_drivers(city_graph, num_drivers):
+    drivers = [TaxiDriver(idx=idx, init_pos=(4, 8), city_graph=city_graph) for idx in range(num_drivers)]
+    for driver in drivers:
+        driver.add_shift(10, 12)
+    return drivers
+
+def test_plan_batch():
+    city_graph = CityGraph(Config().intersections)
+    drivers = _make_drivers(city_graph, 3)
+    # Driver-1 starts from its last drop-off, driver-2 comes back from its shift
+    drivers[1].assign(drivers[1].generate_plan(CustomerCall((4, 7), (4, 6), 12.1)), 0)
+    drivers[2].assign(drivers[2].generate_plan(CustomerCall((0, 6), (5, 12.5), 2)), 0)
+    # Driver-3 is still driving to (4, 12.5) when the call comes
+    drivers.append(TaxiDriver(idx=3, init_pos=(4, 8), city_graph=city_graph))
+    drivers[3].add_shift(10, 13)
+    drivers[3].assign(drivers[3].generate_plan(CustomerCall((4, 7), (4, 12.5), 12.45)), 0)
+
+    call = CustomerCall((2, 7), (4, 13), 12.5)
+    batch = PlanBatch(drivers, call)
+    assert len(batch) == 4
+    for k, driver in enumerate(drivers):
+        plan = driver.generate_plan(call)
+        batch_plan = batch.get_plan(k)
+        for attr in ['start_time', 'end_time', 'start_pos', 'waiting_time_period', 'pickup_distance', 'requested_distance', 'bid', 'value', 'route']:
+            assert getattr(plan, attr) == getattr(batch_plan, attr)
+    assert batch.start_poses[0] == batch.start_poses[2] == (4, 8)
+    assert batch.start_poses[1] == (4, 6)
+
+    # Values of the per-driver plans before the batching:
+    # requested distance (2, 7) -> (2, 12) -> (4, 12) -> (4, 13) = 8, velocity 30,
+    # value = bid (truthful) = 8 * (60 - 4) - pickup_distance * 4
+    # (start_time, start_pos, pickup_distance, waiting_time_period, end_time, value)
+    expected = [(12.5, (4, 8), 3, 3 / 30, 12.5 + 11 / 30, 436),
+                (12.5, (4, 6), 3, 3 / 30, 12.5 + 11 / 30, 436),
+                (12.5, (4, 8), 3, 3 / 30, 12.5 + 11 / 30, 436),
+                (12.45 + 6.5 / 30, (4, 12.5), 7.5, 12.45 + 6.5 / 30 - 12.5 + 7.5 / 30, 12.45 + 6.5 / 30 + 15.5 / 30, 418)]
+    for k, (start_time, start_pos, pickup_distance, waiting_time_period, end_time, value) in enumerate(expected):
+        plan = batch.get_plan(k)
+        assert plan.start_pos == start_pos
+        assert np.isclose(plan.start_time, start_time) and np.isclose(plan.end_time, end_time)
+        assert np.isclose(plan.pickup_distance, pickup_distance) and np.isclose(plan.requested_distance, 8)
+        assert np.isclose(plan.waiting_time_period, waiting_time_period)
+        assert np.isclose(plan.value, value) and np.isclose(plan.bid, value)
+    assert batch.get_plan(3).route == [(4, 12.5), (4, 12), (3, 12), (2, 12), (2, 8), (2, 7), (2, 7), (2, 8), (2, 12), (3, 12), (4, 12), (4, 13)]
+
+def test_driver_state():
+    city_graph = CityGraph(Config().intersections)
+    driver = TaxiDriver(idx=0, init_pos=(4, 8), city_graph=city_graph)
+    driver.add_shift(10, 12)
+    plan = driver.generate_plan(CustomerCall((4, 7), (4, 6), 9))
+    driver.assign(plan, 0)
+    assert driver.state.next_free_time == plan.end_time
+    assert driver.state.end_pos == (4, 6)
+    assert driver.is_restricted(CustomerCall((0, 0), (0, 2), 9.01))
+    assert not driver.is_restricted(CustomerCall((0, 0), (0, 2), 9.5))
+
+    # Starts from the drop-off before the shift, from init_pos after it, also when calls go back in time
+    assert driver.generate_plan(CustomerCall((0, 0), (0, 2), 12.5)).start_pos == (4, 8)
+    assert driver.generate_plan(CustomerCall((0, 0), (0, 2), 9.5)).start_pos == (4, 6)
+    assert driver.state.next_shift_start == 10
+    assert driver.state.last_shift_end is None
+
+if __name__ == '__main__':
+    test_plan_batch()
+    test_driver_state()
@@ -1,6 +1,28 @@
-from util.timeline import TimeLine, TimeLineEvent
+import tempfile
 
-if __name__ == '__main__':
+from util.timeline import TimeLine, TimeLineEvent, dump_packed, load_packed, get_packed_driver_events
+
+def test_packed():
+    timelines = []
+    for driver in range(3):
+        timeline = TimeLine()
+        timeline.add_event(TimeLineEvent(0, 1 + driver, 'Free'))
+        timeline.add_event(TimeLineEvent(1 + driver, 5, 'Call', [(4, 8), (4, 9), (4.5, 9)]))
+        timeline.add_event(TimeLineEvent(10, 20, 'Shift'))
+        timelines.append(timeline)
+    timelines[1].add_event(TimeLineEvent(5, 6, 'Return', [(4.5, 9), (4, 9)]))
+    with tempfile.TemporaryDirectory() as path:
+        dump_packed(path, timelines)
+        events, routes = load_packed(path)
+        assert len(events) == 10 and len(routes) == 11
+        for driver, timeline in enumerate(timelines):
+            loaded = TimeLine.from_packed(get_packed_driver_events(events, driver), routes)
+            assert len(loaded.events) == len(timeline.events)
+            for e, e_loaded in zip(timeline.events, loaded.events):
+                assert (e.start_time, e.end_time, e.event_name) == (e_loaded.start_time, e_loaded.end_time, e_loaded.event_name)
+                assert (e.route is None and e_loaded.route is None) or [list(pos) for pos in e.route] == e_loaded.route
+
+def test_bisect_queries():
     timeline = TimeLine()
     timeline.add_event(TimeLineEvent(0, 10, 'E0'))
     timeline.add_event(TimeLineEvent(11, 12, 'E1'))    
@@ -16,6 +38,26 @@ if __name__ == '__main__':
     assert (timeline.is_valid(TimeLineEvent(15, 20, 'E')) == True)
     assert (timeline.is_valid(TimeLineEvent(33, 35, 'E')) == True)
     assert (timeline.is_valid(TimeLineEvent(34, 35, 'E')) == True)
+    assert (timeline.is_valid(TimeLineEvent(10, 11, 'E')) == True)
+    assert (timeline.is_valid(TimeLineEvent(29, 31, 'E')) == False)
 
-    print(timeline)
+    assert (timeline.get_event(5).event_name == 'E0')
+    assert (timeline.get_event(20) is None)
+    assert (timeline.get_after_event(11).event_name == 'E2')
+    assert (timeline.get_after_event(30) is None)
+    assert (timeline.get_before_event(12).event_name == 'E0')
+    assert (timeline.get_before_event(31).event_name == 'E2')
+    assert (timeline.get_before_event(0) is None)
 
+    # Touching boundaries: E2 ends when E3 starts
+    assert (timeline.get_event(30).event_name == 'E2')
+    assert (timeline.get_event(33).event_name == 'E3')
+    assert (timeline.get_event(10).event_name == 'E0')
+    assert (timeline.get_event(11).event_name == 'E1')
+    assert (timeline.get_after_event(25).event_name == 'E3')
+    assert (timeline.get_before_event(30).event_name == 'E1')
+    assert (timeline.get_before_event(33).event_name == 'E2')
+
+if __name__ == '__main__':
+    test_packed()
+    test_bisect_queries()
@@ -1,26 +1,44 @@
 import numpy as np
-import random
 
 class NormalDistribution(object):
-    def __init__(self, mu=0.0, sigma=1.0):
+    def __init__(self, mu=0.0, sigma=1.0, rng=None):
+        '''
+        rng: numpy Generator, seed or SeedSequence of the samples (None: fresh entropy)
+        '''
+        self.rng = np.random.default_rng(rng)
         self.set(mu, sigma)
 
     def set(self, mu, sigma):
         self.mu = mu
         self.sigma = sigma
 
-    def __call__(self):
+    def __call__(self, size=None):
         # NOTE: Change to Box-Muller in final version
         # NOTE: Handle negative distance
-        return np.clip(np.random.normal(self.mu, self.sigma), 1e-6, 1e6)
+        return np.clip(self.rng.normal(self.mu, self.sigma, size=size), 1e-6, 1e6)
 
 class PoissonProcess(object):
-    def __init__(self, lambd=1.0/40.0):
+    def __init__(self, lambd=1.0/40.0, rng=None):
+        '''
+        rng: numpy Generator, seed or SeedSequence of the samples (None: fresh entropy)
+        '''
+        self.rng = np.random.default_rng(rng)
         self.set(lambd)
 
     def set(self, lambd):        
         self.lambd = lambd
     
     def __call__(self):
-        return random.expovariate(self.lambd)
+        return self.rng.exponential(1.0 / self.lambd)
 
+    def sample_arrivals(self, num_processes, duration=1.0):
+        '''
+        Sample the arrivals of num_processes independent processes within [0, duration).
+        Return (process ids, arrival times) sorted by arrival time.
+        '''
+        # Given its count, the arrival times of a Poisson process are uniformly distributed over the period
+        counts = self.rng.poisson(self.lambd * duration, size=num_processes)
+        process_ids = np.repeat(np.arange(num_processes), counts)
+        arrival_times = self.rng.uniform(0.0, duration, size=len(process_ids))
+        order = np.argsort(arrival_times, kind='stable')
+        return process_ids[order], arrival_times[order]
@@ -0,0 +1,97 @@
+import os
+import numpy as np
+
+# One record per allocated customer call, driver is -1 for a rejected call
+EVENT_DTYPE = np.dtype([('time', '<f8'),
+                        ('start_x', '<f8'), ('start_y', '<f8'),
+                        ('destination_x', '<f8'), ('destination_y', '<f8'),
+                        ('accept', '?'),
+                        ('driver', '<i4'),
+                        ('payment', '<f8'),
+                        ('payoff', '<f8'),
+                        ('start_time', '<f8'),
+                        ('end_time', '<f8'),
+                        ('waiting_time_period', '<f8')])
+
+def read_event_log(path):
+    '''
+    Memory-map the records of an event log file (read-only).
+    '''
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=EVENT_DTYPE)
+    return np.memmap(path, dtype=EVENT_DTYPE, mode='r')
+
+class EventLog(object):
+    '''
+    Append-only log of the allocations: records are buffered in a fixed-size chunk and appended to a binary file
+    (raw EVENT_DTYPE records) whenever the chunk is full, so memory does not grow with the simulation.
+    '''
+    def __init__(self, path, chunk_size=4096):
+        self.path = path
+        self.chunk = np.zeros(chunk_size, dtype=EVENT_DTYPE)
+        self.size = 0
+        self.f = open(path, 'wb')
+
+    def append_accept(self, call, driver_idx, plan, payment, payoff):
+        self._append(call, True, driver_idx, payment, payoff, plan.start_time, plan.end_time, plan.waiting_time_period)
+
+    def append_reject(self, call):
+        self._append(call, False, -1, 0.0, 0.0, 0.0, 0.0, 0.0)
+
+    def _append(self, call, accept, driver_idx, payment, payoff, start_time, end_time, waiting_time_period):
+        if self.size == len(self.chunk):
+            self.flush()
+        self.chunk[self.size] = (call.time, call.start_pos[0], call.start_pos[1], call.destination_pos[0], call.destination_pos[1],
+                                    accept, driver_idx, payment, payoff, start_time, end_time, waiting_time_period)
+        self.size += 1
+
+    def flush(self):
+        if self.f is None:
+            return
+        self.f.write(self.chunk[:self.size].tobytes())
+        self.f.flush()
+        self.size = 0
+
+    def close(self):
+        self.flush()
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+    def read(self):
+        '''
+        Retrieve all the records written so far.
+        '''
+        self.flush()
+        return read_event_log(self.path)
+
+    def get_history_payoff(self):
+        '''
+        Retrieve the company's payments, see TaxiCoordinator.get_history_payoff
+        '''
+        records = self.read()
+        return np.asarray(records['payment'][records['accept']])
+
+    def get_history_calls(self):
+        '''
+        Retrieve the allocated calls, see TaxiCoordinator.get_history_calls
+        '''
+        records = self.read()
+        return [{'time': time, 'start_pos': (start_x, start_y), 'accept': accept}
+                    for time, start_x, start_y, accept in zip(records['time'].tolist(), records['start_x'].tolist(),
+                                                              records['start_y'].tolist(), records['accept'].tolist())]
+
+    def get_driver_history_payoff(self, driver_idx):
+        '''
+        Retrieve the payoffs of a driver, see TaxiDriver.get_history_payoff
+        '''
+        records = self.read()
+        return np.asarray(records['payoff'][records['driver'] == driver_idx])
+
+    def get_driver_waiting_time_periods(self, driver_idx):
+        '''
+        Retrieve the waiting time periods of a driver's calls by start time, see TaxiDriver.get_waiting_time_periods
+        '''
+        records = self.read()
+        records = records[records['driver'] == driver_idx]
+        return np.asarray(records['waiting_time_period'][np.argsort(records['start_time'], kind='stable')])
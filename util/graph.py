@@ -1,43 +1,101 @@
+import heapq
 import numpy as np
 
 from util.defines import INF
 
+# Graphs with more vertices than this are solved with Dijkstra by default
+DENSE_VERTEX_LIMIT = 1024
+
 class Graph(object):
-    def __init__(self, graph):
+    def __init__(self, graph, method='auto'):
+        '''
+        graph: adjacency matrix, zeros (off the diagonal) and INF mark missing edges
+        method: 'floyd-warshall', 'dijkstra' or 'auto' (choose by the size of the graph)
+        '''
         num_vertex = len(graph)
+        if method == 'auto':
+            method = 'floyd-warshall' if num_vertex <= DENSE_VERTEX_LIMIT else 'dijkstra'
+
+        # set zeros to any large number which is bigger then the longest way
+        no_edge = (graph == 0) | (graph >= INF)
+        np.fill_diagonal(no_edge, False)
+        graph[no_edge] = INF
 
-        p = np.zeros(graph.shape)
-        for i in range(0, num_vertex):
-            for j in range(0, num_vertex):
-                p[i,j] = i
-                if (i != j and graph[i,j] == 0): 
-                    p[i,j] = -INF 
-                    graph[i,j] = INF # set zeros to any large number which is bigger then the longest way
-
-        for k in range(0, num_vertex):
-            for i in range(0, num_vertex):
-                for j in range(0, num_vertex):
-                    if graph[i,j] > graph[i,k] + graph[k,j]:
-                        graph[i,j] = graph[i,k] + graph[k,j]
-                        p[i,j] = p[k,j]
+        if method == 'floyd-warshall':
+            p = self._floyd_warshall(graph)
+        elif method == 'dijkstra':
+            p = self._dijkstra(graph)
+        else:
+            raise Exception('Error: invalid shortest path method {}.'.format(method))
         self.distance_matrix = graph
         self.predessor_matrix = p
 
+    def _floyd_warshall(self, graph):
+        '''
+        Relax all pairs through k with one broadcast per k. Fill graph with the distances in-place and return the predecessor matrix.
+        '''
+        num_vertex = len(graph)
+        p = np.repeat(np.arange(num_vertex, dtype=np.float64)[:, np.newaxis], num_vertex, axis=1)
+        p[graph >= INF] = -INF
+
+        # Relax in-place, INF + INF still fits in int32
+        dist = graph
+        candidate = np.empty_like(dist)
+        shorter = np.empty(dist.shape, dtype=bool)
+        for k in range(num_vertex):
+            np.add(dist[:, k, np.newaxis], dist[np.newaxis, k, :], out=candidate)
+            np.greater(dist, candidate, out=shorter)
+            np.copyto(dist, candidate, where=shorter)
+            np.copyto(p, p[k], where=shorter)
+        return p
+
+    def _dijkstra(self, graph):
+        '''
+        Run Dijkstra from every vertex over adjacency lists. Fill graph with the distances in-place and return the predecessor matrix.
+        '''
+        num_vertex = len(graph)
+        has_edge = graph < INF
+        np.fill_diagonal(has_edge, False)
+        neighbors = [np.flatnonzero(row).tolist() for row in has_edge]
+        weights = [graph[u, neighbors[u]].tolist() for u in range(num_vertex)]
+
+        dist_matrix = np.full(graph.shape, INF, dtype=np.int64)
+        p = np.full(graph.shape, -INF, dtype=np.float64)
+        for source in range(num_vertex):
+            dist = dist_matrix[source]
+            pred = p[source]
+            dist[source] = 0
+            pred[source] = source
+            done = np.zeros(num_vertex, dtype=bool)
+            heap = [(0, source)]
+            while heap:
+                d, u = heapq.heappop(heap)
+                if done[u]:
+                    continue
+                done[u] = True
+                for v, w in zip(neighbors[u], weights[u]):
+                    if d + w < dist[v]:
+                        dist[v] = d + w
+                        pred[v] = u
+                        heapq.heappush(heap, (d + w, v))
+        graph[...] = dist_matrix
+        return p
+
     def get_path(self, i, j):
         i, j = int(i), int(j)
         if i == j:
             return [i]
         elif self.predessor_matrix[i,j] == -INF:
             return [None]
-        else:
-            preds = self.get_path(i, self.predessor_matrix[i,j]);
-            return preds + [j]
+        # Walk the predecessors back from j, no recursion
+        pred = self.predessor_matrix[i]
+        path = [j]
+        while j != i:
+            j = int(pred[j])
+            path.append(j)
+        path.reverse()
+        return path
 
 if __name__ == '__main__':
     graph = np.array([[0,10,20,30,0,0],[0,0,0,0,0,7],[0,0,0,0,0,5],[0,0,0,0,10,0],[2,0,0,0,0,4],[0,5,7,0,6,0]])
     g = Graph(graph)
-
-
-        
-        
-        
@@ -0,0 +1,106 @@
+import time
+
+from collections import defaultdict
+
+'''
+Opt-in instrumentation of the simulation stages.
+The stages are wrapped with `with profiling.timer(name):`, which does nothing until enable() is called.
+'''
+
+class _Timer(object):
+    __slots__ = ['profiler', 'name', 'start']
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.seconds[self.name] += time.perf_counter() - self.start
+        self.profiler.calls[self.name] += 1
+        return False
+
+class _NullTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class Profiler(object):
+    '''
+    Accumulated wall time and number of runs of each timed stage, and named counters.
+    '''
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.end = None
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+
+    def timer(self, name):
+        return _Timer(self, name)
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def stop(self):
+        '''
+        Freeze the wall time, the stages may still be timed.
+        '''
+        self.end = time.perf_counter()
+
+    def get_wall_time(self):
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def get_stage_stats(self):
+        '''
+        Retrieve rows [stage, runs, total seconds, % of the wall time, average microseconds] by decreasing total time.
+        '''
+        wall_time = self.get_wall_time()
+        rows = []
+        for name in sorted(self.seconds, key=lambda name: -self.seconds[name]):
+            seconds = self.seconds[name]
+            rows.append([name, self.calls[name], seconds, 100.0 * seconds / wall_time, 1e6 * seconds / self.calls[name]])
+        return rows
+
+    def get_throughput(self, counter, stage):
+        '''
+        Retrieve counter per second of stage, None if the stage has not run.
+        '''
+        seconds = self.seconds.get(stage, 0.0)
+        return self.counters[counter] / seconds if seconds > 0 else None
+
+_profiler = None
+
+def enable():
+    '''
+    Start profiling, return the Profiler.
+    '''
+    global _profiler
+    _profiler = Profiler()
+    return _profiler
+
+def disable():
+    global _profiler
+    _profiler = None
+
+def get_profiler():
+    return _profiler
+
+def timer(name):
+    '''
+    Context manager timing a stage, a shared no-op when profiling is disabled.
+    '''
+    if _profiler is None:
+        return _NULL_TIMER
+    return _Timer(_profiler, name)
+
+def count(name, n=1):
+    if _profiler is not None:
+        _profiler.counters[name] += n
@@ -1,4 +1,6 @@
+import os
 import json
+import numpy as np
 
 from sortedcontainers import SortedList
 from collections import namedtuple
@@ -8,6 +10,15 @@ Endpoint = namedtuple('Endpoint', ['time', 'type'])
 TYPE_START = True
 TYPE_END = False
 
+# Packed schedules: one record per event, the route of an event is routes[route_offset:route_offset + route_length]
+EVENT_NAMES = ['Free', 'Shift', 'Call', 'Return']
+PACKED_EVENT_DTYPE = np.dtype([('driver', '<i4'),
+                               ('start_time', '<f8'),
+                               ('end_time', '<f8'),
+                               ('event_type', 'u1'),
+                               ('route_offset', '<i8'),
+                               ('route_length', '<i4')])
+
 def _is_overlap(e1, e2):
     '''
     Assume e1, e2 are TimeLineEvent and their start_time < end_time
@@ -52,33 +63,47 @@ class TimeLine(object):
         return valid
 
     def is_valid(self, e):
+        '''
+        Check e does not overlap any event. Events never overlap, so their end times are sorted as well
+        and only the neighbours of e's start time need to be checked.
+        '''
         if e.start_time >= e.end_time:
             raise Exception('Error: start time >= end_time. {}'.format(e))
-        if len(self.events) == 0:
-            return True
-        else:
-            for existing_event in self.events:
-                if existing_event.start_time > e.end_time:
-                    return True
-                if _is_overlap(e, existing_event):
-                    return False
-            return True
+        idx = self.events.bisect_key_left(e.start_time)
+        if idx > 0 and _is_overlap(e, self.events[idx - 1]):
+            return False
+        if idx < len(self.events) and _is_overlap(e, self.events[idx]):
+            return False
+        return True
 
     def get_event(self, time):
-        for e in self.events:
+        '''
+        Retrieve the first event containing time, None if there is no such event.
+        '''
+        idx = self.events.bisect_key_right(time)
+        # An event ending at time may precede the event starting at time
+        for e in self.events.islice(max(idx - 2, 0), idx):
             if time >= e.start_time and time <= e.end_time:
                 return e
         return None
 
     def get_after_event(self, time):
-        for e in self.events:
-            if e.start_time > time:
-                return e
+        '''
+        Retrieve the first event starting after time.
+        '''
+        idx = self.events.bisect_key_right(time)
+        if idx < len(self.events):
+            return self.events[idx]
         return None
 
     def get_before_event(self, time):
-        for e in reversed(self.events):
-            if e.start_time < time and e.end_time < time:
+        '''
+        Retrieve the last event ending before time.
+        '''
+        idx = self.events.bisect_key_left(time)
+        # Only the last event starting before time may still be running at time
+        for e in self.events.islice(max(idx - 2, 0), idx, reverse=True):
+            if e.end_time < time:
                 return e
         return None
 
@@ -93,6 +118,59 @@ class TimeLine(object):
         with open(path, 'w') as f:
             json.dump(l, f, cls=TimeLineEventJSONEncoder)
 
+    def pack(self, driver=0):
+        '''
+        Retrieve the events as PACKED_EVENT_DTYPE records of driver and the flat (n, 2) buffer of their route points.
+        '''
+        events = np.zeros(len(self.events), dtype=PACKED_EVENT_DTYPE)
+        routes = []
+        for k, e in enumerate(self.events):
+            route = e.route if e.route is not None else []
+            events[k] = (driver, e.start_time, e.end_time, EVENT_NAMES.index(e.event_name), len(routes), len(route))
+            routes.extend(route)
+        return events, np.asarray(routes, dtype=np.float64).reshape(-1, 2)
+
+    @staticmethod
+    def from_packed(events, routes):
+        '''
+        Rebuild a TimeLine from packed records (of a single driver), events without route points get route None.
+        '''
+        timeline = TimeLine()
+        for start_time, end_time, event_type, route_offset, route_length in zip(events['start_time'].tolist(), events['end_time'].tolist(),
+                                                                                events['event_type'].tolist(), events['route_offset'].tolist(),
+                                                                                events['route_length'].tolist()):
+            route = routes[route_offset:route_offset + route_length].tolist() if route_length > 0 else None
+            timeline.events.add(TimeLineEvent(start_time, end_time, EVENT_NAMES[event_type], route))
+        return timeline
+
+def dump_packed(path, timelines):
+    '''
+    Write the timelines of all drivers (driver k is timelines[k]) to the directory path as events.npy and routes.npy.
+    '''
+    packed = [timeline.pack(driver) for driver, timeline in enumerate(timelines)]
+    route_offset = 0
+    for events, routes in packed:
+        events['route_offset'] += route_offset
+        route_offset += len(routes)
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, 'events.npy'), np.concatenate([events for events, _ in packed]) if len(packed) > 0 else np.zeros(0, dtype=PACKED_EVENT_DTYPE))
+    np.save(os.path.join(path, 'routes.npy'), np.concatenate([routes for _, routes in packed]) if len(packed) > 0 else np.zeros((0, 2)))
+
+def load_packed(path):
+    '''
+    Memory-map the events and the route points of dump_packed (read-only), events are sorted by driver then start time.
+    '''
+    events = np.load(os.path.join(path, 'events.npy'), mmap_mode='r')
+    routes = np.load(os.path.join(path, 'routes.npy'), mmap_mode='r')
+    return events, routes
+
+def get_packed_driver_events(events, driver):
+    '''
+    Retrieve the packed events of a driver.
+    '''
+    lo, hi = np.searchsorted(events['driver'], [driver, driver + 1])
+    return events[lo:hi]
+
 
         
 
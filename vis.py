@@ -1,9 +1,10 @@
+import argparse
 import pygame
 import sys
 import json
 import os
 
-from gen_vis import compute_timings, compute
+from gen_vis import Playback, CallStream, load_packed_schedules, STATE_FREE, STATE_SHIFT, STATE_DRIVING
 from simulator.city_graph import CityGraph
 from config import Config
 
@@ -19,102 +20,98 @@ BLUE = (0, 0, 255)
 CIRCLE_RADIUS = 20
 SPEED = 0.6
 
-# Initialization
-pygame.init()
-screen = pygame.display.set_mode(SCREEN_SIZE)
-pygame.display.set_caption('Visualization')
-fps = pygame.time.Clock()
-paused = False
-
 def convert_pos(pos):
     global SCALE, HEIGHT
     return [int(pos[1] * SCALE), HEIGHT - int(pos[0] * SCALE)]
 
-class Car(object):
-    def __init__(self, schedule, speed):
-        self.schedule = schedule
-        self.speed = speed
-        self.pos = [4, 8]
-        self.color = GREEN
-        self.prev_event = None    
-    
-    def update(self, t):
-        global SPEED 
-        for s in self.schedule:   
-            if t >= s['start_time'] and t < s['end_time']:
-                event_name = s['event_name']
-                if event_name == 'Free':
-                    if self.prev_event is None:
-                        self.pos = [4, 8]
-                    elif self.prev_event['event_name'] == 'Call' or self.prev_event['event_name'] == 'Return':
-                        self.pos = self.prev_event['route'][-1]
-                    self.color = GREEN
-                if event_name == 'Call' or event_name == 'Return':                            
-                    timings = compute_timings(s['start_time'], s['route'], self.speed)
-                    self.pos = compute(s['route'], timings, t)
-                    self.color = RED
-                if event_name == 'Shift': 
-                    self.pos = [4, 8]
-                    self.color = BLUE
-                self.prev_event = s                
-                break
-    def draw(self):        
-        pos = convert_pos(self.pos)
-        pygame.draw.circle(screen, self.color, pos, CIRCLE_RADIUS, 0)
+# Color of each car state of the playback
+STATE_COLORS = {STATE_FREE: GREEN, STATE_SHIFT: BLUE, STATE_DRIVING: RED}
+
+def draw_cars(surface, poses, states):
+    for pos, state in zip(poses.tolist(), states.tolist()):
+        pygame.draw.circle(surface, STATE_COLORS[state], convert_pos(pos), CIRCLE_RADIUS, 0)
 
 class Grid(object):
     def __init__(self, edges):
         self.edges = edges
-   
-    def draw(self):
-        global screen
+
+    def draw(self, surface):
         for e in self.edges:
             u = convert_pos(e[0])
             v = convert_pos(e[1])
-            pygame.draw.line(screen, WHITE, u, (v))
-
-def draw_calls(t, calls):
+            pygame.draw.line(surface, WHITE, u, (v))
+
+    def make_background(self):
+        '''
+        Render the grid once on a black surface, blit it at the start of each frame.
+        '''
+        background = pygame.Surface(SCREEN_SIZE)
+        background.fill(BLACK)
+        self.draw(background)
+        return background
+
+def draw_calls(surface, t, calls):
     eps = (SPEED / 30.0)
-    for call in calls:
-        if abs(call['time'] - t) < eps:
-            color = (255, 255, 0) if call['accept'] else (255, 0, 255)            
-            pygame.draw.circle(screen, color, convert_pos(call['start_pos']), 10, 0)
-        if call['time'] > t + eps:
-            break
+    visible = calls.get_range(t, eps)
+    for start_pos, accept in zip(calls.start_poses[visible].tolist(), calls.accepts[visible].tolist()):
+        color = (255, 255, 0) if accept else (255, 0, 255)
+        pygame.draw.circle(surface, color, convert_pos(start_pos), 10, 0)
+
+def draw_frame(surface, background, t, playback, calls):
+    '''
+    Draw the replay at time t (hour_simulation) on surface.
+    '''
+    surface.blit(background, (0, 0))
+    draw_calls(surface, t, calls)
+    poses, states = playback.update(t)
+    draw_cars(surface, poses, states)
 
 def load(path):
     with open(path, 'r') as f:
         schedule = json.load(f)
-    return Car(schedule, 30)
+    return schedule
 
 def load_call(path):
     with open(path, 'r') as f:
         calls = json.load(f)
     return calls
 
-cars = [load(os.path.join('data', 'driver-relative-0-%03d.json' % i)) for i in range(12)]
-calls = load_call(os.path.join('data', 'history-calls.json'))
-edges = CityGraph(Config().intersections).edge_poses
-grid = Grid(edges)
-
-
-def update(t):
-    print(t)
-    for car in cars:
-        car.update(t)    
-t = 0
-def render():
-    global t
-    screen.fill(BLACK)
-    grid.draw()
-    draw_calls(t * (SPEED / 30.0), calls)
-    for car in cars:        
-        car.draw()
-    pygame.display.update()
-    fps.tick(60)
-    t += 1
-
-while True:
-    update(t * (SPEED / 30.0))
-    render()
-
+def load_replay(data_dir, schedule_format='json', num_drivers=12):
+    '''
+    Load the dumped run of data_dir as a Playback and a CallStream.
+    schedule_format: 'json' for the driver-*.json schedules, 'packed' for data_dir/schedules (main.py --dump-format)
+    '''
+    if schedule_format == 'packed':
+        schedules = load_packed_schedules(os.path.join(data_dir, 'schedules'))
+    elif schedule_format == 'json':
+        schedules = [load(os.path.join(data_dir, 'driver-relative-0-%03d.json' % i)) for i in range(num_drivers)]
+    else:
+        raise Exception('error: invalid schedule_format {}.'.format(schedule_format))
+    playback = Playback(schedules, 30)
+    calls = CallStream(load_call(os.path.join(data_dir, 'history-calls.json')))
+    return playback, calls
+
+def load_grid():
+    config = Config()
+    return Grid(CityGraph(config.intersections, cache_dir=config.graph_cache_dir).edge_poses)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--schedule-format', help='Format of the dumped schedules (main.py --dump-format)', type=str, choices=['json', 'packed'], default='json')
+    args = parser.parse_args()
+
+    # Initialization
+    pygame.init()
+    screen = pygame.display.set_mode(SCREEN_SIZE)
+    pygame.display.set_caption('Visualization')
+    fps = pygame.time.Clock()
+
+    playback, calls = load_replay('data', args.schedule_format)
+    background = load_grid().make_background()
+
+    t = 0
+    while True:
+        draw_frame(screen, background, t * (SPEED / 30.0), playback, calls)
+        pygame.display.update()
+        fps.tick(60)
+        t += 1